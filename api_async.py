@@ -0,0 +1,135 @@
+# ====================================================================================================
+# Asyncio variants of the connectors and an orchestrator to run many extractions at the same time
+#
+# Documentation:
+#     - asyncio (semaphore) : https://docs.python.org/3/library/asyncio-sync.html#asyncio.Semaphore
+#     - asyncio (executor)  : https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.run_in_executor
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import asyncio
+import contextvars
+import functools
+import importlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Default amount of extractions running at the same time for each vendor
+VENDOR_LIMITS = {
+    'harvest'       : 2,
+    'lattice'       : 2,
+    'bamboohr'      : 2,
+    'greenhouse'    : 2,
+    'salesforce'    : 2,
+}
+
+# Executor of the blocking calls, extractAll sets its own one (None is the default executor of the loop)
+_executor = contextvars.ContextVar('api_async_executor', default=None)
+
+# ¡--- Run a blocking call in the current executor, keeping the context variables (like asyncio.to_thread) ---!
+async def _runBlocking(call, *args, **kwargs):
+    call_context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor.get(), functools.partial(call_context.run, call, *args, **kwargs))
+
+class AsyncConnector:
+    # ¡--- Initiate the asyncio variant of a connector (the connector itself is built on first use) ---!
+    # - Requires: the same arguments as the connector (e.g. the path of the json file with the credentials)
+    # - Every method of the connector becomes a coroutine, the blocking calls run in a thread executor so the
+    #   connectors keep sharing the pooled transport while many of them are awaited on a single event loop
+    # - Outside of extractAll that's the default executor of the loop, which runs min(32, cpu + 4) calls at a time
+    connector_module = None
+    connector_class = None
+    vendor = None
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._connector = None
+        self._lock = threading.Lock()
+
+    # ¡--- Get the sync connector, building it once (logins and credential reads never block the loop) ---!
+    def connect(self):
+        with self._lock:
+            if self._connector is None:
+                connector_class = getattr(importlib.import_module(self.connector_module), self.connector_class)
+                self._connector = connector_class(*self._args, **self._kwargs)
+
+        return self._connector
+
+    def __getattr__(self, method_name):
+        if method_name.startswith('_'):
+            raise AttributeError(method_name)
+
+        async def method_async(*args, **kwargs):
+            connector = await _runBlocking(self.connect)
+            return await _runBlocking(getattr(connector, method_name), *args, **kwargs)
+
+        method_async.__name__ = method_name
+        return method_async
+
+class AsyncHarvest(AsyncConnector):
+    connector_module, connector_class, vendor = 'api_harvest', 'Harvest', 'harvest'
+
+class AsyncLattice(AsyncConnector):
+    connector_module, connector_class, vendor = 'api_lattice', 'Lattice', 'lattice'
+
+class AsyncBamboo(AsyncConnector):
+    connector_module, connector_class, vendor = 'api_bamboohr', 'Bamboo', 'bamboohr'
+
+class AsyncGreenhouse(AsyncConnector):
+    connector_module, connector_class, vendor = 'api_greenhouse', 'Greenhouse', 'greenhouse'
+
+class AsyncSimpleSF(AsyncConnector):
+    connector_module, connector_class, vendor = 'api_salesforce', 'SimpleSF', 'salesforce'
+
+# ¡--- Run a list of extractions at the same time, capped per vendor ---!
+# - Requires: a list of extractions, each one a dictionary with
+#   - name      : the key of its result
+#   - connector : an async connector (e.g. AsyncHarvest('harvest.json'))
+#   - method    : the connector method to call (e.g. 'getTimeEntries')
+#   - kwargs    : (optional) the arguments of the method
+# - Optional: a dictionary with the amount of extractions running at the same time per vendor
+# - Returns a dictionary keyed by name, extractions that raised keep their exception as result
+# - The blocking calls run in a dedicated executor with one thread per allowed extraction (the sum of the limits of
+#   the vendors used), the default executor is capped at min(32, cpu + 4) threads and would hold them back
+async def extractAll(extractions, vendor_limits=None):
+    vendor_limits = {**VENDOR_LIMITS, **(vendor_limits or {})}
+    vendor_semaphores = {}
+    for extraction_ent in extractions:
+        extraction_vendor = extraction_ent['connector'].vendor
+        if extraction_vendor not in vendor_semaphores:
+            vendor_semaphores[extraction_vendor] = asyncio.Semaphore(vendor_limits.get(extraction_vendor, 1))
+
+    async def extract(extraction_ent):
+        extraction_connector = extraction_ent['connector']
+        async with vendor_semaphores[extraction_connector.vendor]:
+            logging.info(f'API [async][{extraction_connector.vendor}]: Starting extraction [{extraction_ent["name"]}]')
+            extraction_start = time.monotonic()
+            extraction_result = await getattr(extraction_connector, extraction_ent['method'])(**extraction_ent.get('kwargs', {}))
+            logging.info(f'API [async][{extraction_connector.vendor}]: Extraction [{extraction_ent["name"]}] finished in [{time.monotonic() - extraction_start:.2f}] seconds')
+
+        return extraction_result
+
+    extraction_executor = ThreadPoolExecutor(
+        max_workers         = max(1, sum(vendor_limits.get(extraction_vendor, 1) for extraction_vendor in vendor_semaphores)),
+        thread_name_prefix  = 'api-async'
+    )
+    executor_token = _executor.set(extraction_executor)
+    try:
+        extraction_results = await asyncio.gather(*(extract(extraction_ent) for extraction_ent in extractions), return_exceptions=True)
+    finally:
+        _executor.reset(executor_token)
+        extraction_executor.shutdown(wait=False)
+
+    for extraction_ent, extraction_result in zip(extractions, extraction_results):
+        if isinstance(extraction_result, Exception):
+            logging.error(f'API [async][{extraction_ent["connector"].vendor}]: Extraction [{extraction_ent["name"]}] failed ({extraction_result.__class__.__name__})')
+            logging.error(f'API [async][{extraction_ent["connector"].vendor}]: {extraction_result}')
+
+    return {extraction_ent['name']: extraction_result for extraction_ent, extraction_result in zip(extractions, extraction_results)}
+
+# ¡--- Blocking entry point of extractAll, for scripts that don't run their own event loop ---!
+def runExtractions(extractions, vendor_limits=None):
+    return asyncio.run(extractAll(extractions, vendor_limits))
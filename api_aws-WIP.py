@@ -1,56 +1,268 @@
-#====================================================================================================
+# ====================================================================================================
 # Script to work with AWS's sdk
 #
+# Documentation:
+#     - redshift data api : https://docs.aws.amazon.com/redshift-data/latest/APIReference/Welcome.html
+#
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
-import boto3
+import asyncio
 import logging
-import pandas as pd
 import time
 
-def redshift(region, credentials, sql):
-    client = boto3.client('redshift-data', region_name=region)
+from api_lazy import lazyImport
+from api_metrics import emit, metricsEnabled
+
+boto3 = lazyImport('boto3')
+pd = lazyImport('pandas')
+
+# Value field and dtype used for each redshift column type, anything else is kept as an object column
+REDSHIFT_TYPES = {
+    'int2'          : ('longValue', 'Int64'),
+    'int4'          : ('longValue', 'Int64'),
+    'int8'          : ('longValue', 'Int64'),
+    'float4'        : ('doubleValue', 'Float64'),
+    'float8'        : ('doubleValue', 'Float64'),
+    'numeric'       : ('stringValue', 'numeric'),
+    'bool'          : ('booleanValue', 'boolean'),
+    'date'          : ('stringValue', 'datetime'),
+    'timestamp'     : ('stringValue', 'datetime'),
+    'timestamptz'   : ('stringValue', 'datetimetz'),
+}
+
+# ¡--- Execute a statement and return its results as a data-frame ---!
+# - https://docs.aws.amazon.com/redshift-data/latest/APIReference/API_ExecuteStatement.html
+# - Requires: the aws region, a credentials dictionary (cluster, database, user) and the sql statement
+# - Optional: the overall deadline in seconds and an existing redshift-data client
+# - Returns 0 when the statement fails or doesn't finish before the deadline
+def redshift(region, credentials, sql, timeout=150, client=None):
+    client = client or boto3.client('redshift-data', region_name=region)
+    query_start = time.monotonic()
+    query_id = _redshiftExecute(client, credentials, sql)
+
+    # poll with short intervals first, so quick statements don't wait for a long sleep
+    query_deadline = time.monotonic() + timeout
+    for query_wait in _redshiftIntervals():
+        query_des = client.describe_statement(Id=query_id)
+        query_status = _redshiftStatus(client, query_des, query_deadline)
+        if query_status != 'WAITING':
+            break
+        time.sleep(query_wait)
+
+    if query_status != 'FINISHED':
+        return _redshiftEmit(0, query_status, query_start)
+
+    return _redshiftEmit(_redshiftResult(client, query_des), query_status, query_start)
+
+# ¡--- Asyncio variant of redshift, many statements can be awaited at the same time ---!
+# - Requires: the aws region, a credentials dictionary (cluster, database, user) and the sql statement
+# - Optional: the overall deadline in seconds and an existing redshift-data client (clients are thread safe)
+# - The blocking sdk calls run in the default executor, the polling waits don't hold any thread
+async def redshiftAsync(region, credentials, sql, timeout=150, client=None):
+    client = client or boto3.client('redshift-data', region_name=region)
+    query_start = time.monotonic()
+    query_id = await asyncio.to_thread(_redshiftExecute, client, credentials, sql)
+
+    query_deadline = time.monotonic() + timeout
+    for query_wait in _redshiftIntervals():
+        query_des = await asyncio.to_thread(client.describe_statement, Id=query_id)
+        query_status = _redshiftStatus(client, query_des, query_deadline)
+        if query_status != 'WAITING':
+            break
+        await asyncio.sleep(query_wait)
+
+    if query_status != 'FINISHED':
+        return _redshiftEmit(0, query_status, query_start)
+
+    return _redshiftEmit(await asyncio.to_thread(_redshiftResult, client, query_des), query_status, query_start)
+
+# ¡--- Execute many independent statements at the same time and return their results ---!
+# - https://docs.aws.amazon.com/redshift-data/latest/APIReference/API_ExecuteStatement.html
+# - Requires: the aws region, a credentials dictionary (cluster, database, user) and the statements, either a list
+#   or a dictionary keyed by name, each one a sql string or a dictionary with its sql and parameters
+#   (e.g. {'sql': 'select * from t where id = :id', 'parameters': [{'name': 'id', 'value': '1'}]})
+# - Optional: the overall deadline in seconds and an existing redshift-data client
+# - Returns a dictionary keyed by name (or position) with the result (0 on failure), status, error,
+#   elapsed seconds until the statement was seen as done and the duration reported by redshift
+def redshiftBatch(region, credentials, statements, timeout=150, client=None):
+    client = client or boto3.client('redshift-data', region_name=region)
+    if not isinstance(statements, dict):
+        statements = dict(enumerate(statements))
+
+    batch_result = {}
+    batch_pending = {}
+    batch_start = time.monotonic()
+
+    logging.info(f'SDK [AWS | REDSHIFT]: Submitting batch of [{len(statements)}] statements')
+    for query_name, query_ent in statements.items():
+        if isinstance(query_ent, dict):
+            query_sql, query_parameters = query_ent['sql'], query_ent.get('parameters')
+        else:
+            query_sql, query_parameters = query_ent, None
+
+        try:
+            batch_pending[query_name] = _redshiftExecute(client, credentials, query_sql, query_parameters)
+        except Exception as query_error:
+            logging.error(f'SDK [AWS | REDSHIFT]: Could not submit statement [{query_name}] ({query_error.__class__.__name__})')
+            batch_result[query_name] = _redshiftBatchEntry(0, 'FAILED', str(query_error), batch_start, {})
+
+    # a single loop polls every outstanding statement, finished ones are read while the rest keep running
+    # - a statement that can't be described or read is recorded as failed (and cancelled), the rest carry on
+    # - the statements still pending are cancelled when the loop exits abnormally (e.g. KeyboardInterrupt)
+    query_deadline = batch_start + timeout
+    try:
+        for query_wait in _redshiftIntervals():
+            for query_name, query_id in list(batch_pending.items()):
+                try:
+                    query_des = client.describe_statement(Id=query_id)
+                    query_status = _redshiftStatus(client, query_des, query_deadline)
+                    if query_status == 'WAITING':
+                        continue
+                    elif query_status == 'FINISHED':
+                        query_entry = _redshiftBatchEntry(_redshiftResult(client, query_des), query_status, None, batch_start, query_des)
+                    else:
+                        query_entry = _redshiftBatchEntry(0, query_status, query_des.get('Error', 'Query timed-out'), batch_start, query_des)
+
+                except Exception as query_error:
+                    logging.error(f'SDK [AWS | REDSHIFT]: Statement [{query_name}] failed while polling ({query_error.__class__.__name__})')
+                    _redshiftCancel(client, query_id)
+                    query_entry = _redshiftBatchEntry(0, 'FAILED', str(query_error), batch_start, {})
 
+                del batch_pending[query_name]
+                batch_result[query_name] = query_entry
+
+            if not batch_pending:
+                break
+            logging.info(f'SDK [AWS | REDSHIFT]: Waiting for [{len(batch_pending)}] statements to finish')
+            time.sleep(query_wait)
+
+    finally:
+        for query_id in batch_pending.values():
+            _redshiftCancel(client, query_id)
+
+    logging.info(f'SDK [AWS | REDSHIFT]: Batch finished in [{time.monotonic() - batch_start:.2f}] seconds')
+    return {query_name: batch_result[query_name] for query_name in statements}
+
+# ¡--- Result entry of a batch statement ---!
+def _redshiftBatchEntry(query_result, query_status, query_error, batch_start, query_des):
+    _redshiftEmit(query_result, query_status, batch_start)
+    return {
+        'result'    : query_result,
+        'status'    : query_status,
+        'error'     : query_error,
+        'elapsed'   : time.monotonic() - batch_start,
+        'duration'  : query_des['Duration'] / 1e9 if query_des.get('Duration', -1) >= 0 else None,
+    }
+
+# ¡--- Report a statement to the instrumentation hooks (api_metrics) and hand its result back ---!
+def _redshiftEmit(query_result, query_status, query_start):
+    emit(
+        'redshift', {'status': query_status},
+        seconds = time.monotonic() - query_start,
+        rows    = len(query_result) if query_status == 'FINISHED' else 0
+    )
+
+    return query_result
+
+# ¡--- Submit a statement (and its optional parameters) to the data api and return its id ---!
+def _redshiftExecute(client, credentials, sql, parameters=None):
+    query_kwargs = {'Parameters': parameters} if parameters else {}
     query_req = client.execute_statement(
         ClusterIdentifier   = credentials['cluster'],
         Database            = credentials['database'],
         DbUser              = credentials['user'],
-        Sql                 = sql
+        Sql                 = sql,
+        **query_kwargs
     )
-    query_id = query_req['Id']
 
-    # create waiter for the query
-    query_status = ''
-    wait_cnt = 0
-    while query_status != 'FINISHED':
-        
-        query_des = client.describe_statement(Id=query_id)
-        query_status = query_des['Status']
+    return query_req['Id']
 
-        if query_status == 'FAILED' or wait_cnt == 15:
-            logging.error('SDK [AWS | REDSHIFT]: Query failed or timed-out')
-            return 0
-        else:
-            logging.info('SDK [AWS | REDSHIFT]: Waiting [10 seconds] for query to finish')
-            wait_cnt += 1
-            time.sleep(10)
+# ¡--- Polling intervals: exponential from 0.1 seconds, capped at 5 seconds ---!
+def _redshiftIntervals(wait_start=0.1, wait_factor=1.5, wait_max=5):
+    query_wait = wait_start
+    while True:
+        yield query_wait
+        query_wait = min(query_wait * wait_factor, wait_max)
+
+# ¡--- Map a describe_statement response into FINISHED, FAILED or WAITING (cancels it once past the deadline) ---!
+def _redshiftStatus(client, query_des, query_deadline):
+    query_status = query_des['Status']
+
+    if query_status == 'FINISHED':
+        return query_status
+    elif query_status in ('FAILED', 'ABORTED'):
+        logging.error(f'SDK [AWS | REDSHIFT]: Query failed ({query_des.get("Error", query_status)})')
+        return 'FAILED'
+    elif time.monotonic() >= query_deadline:
+        logging.error('SDK [AWS | REDSHIFT]: Query timed-out, cancelling statement')
+        _redshiftCancel(client, query_des['Id'])
+        return 'FAILED'
+
+    logging.info(f'SDK [AWS | REDSHIFT]: Waiting for query to finish ({query_status})')
+    return 'WAITING'
+
+# ¡--- Cancel a statement, failures are only logged (it may have finished in the meantime) ---!
+def _redshiftCancel(client, query_id):
+    try:
+        client.cancel_statement(Id=query_id)
+    except Exception as cancel_error:
+        logging.error(f'SDK [AWS | REDSHIFT]: Could not cancel statement ({cancel_error.__class__.__name__})')
+
+# ¡--- Read every result page (NextToken) of a finished statement into a typed data-frame ---!
+# - https://docs.aws.amazon.com/redshift-data/latest/APIReference/API_GetStatementResult.html
+def _redshiftResult(client, query_des):
+    if query_des.get('HasResultSet') == False:
+        logging.info('SDK [AWS | REDSHIFT]: Query successful, no result set returned')
+        return pd.DataFrame()
 
-    # convert the results into a dataframe
     logging.info(('SDK [AWS | REDSHIFT]: Query successful, converting into data-frame'))
-    query_res = client.get_statement_result(Id=query_id)
+    result_kwargs = {'Id': query_des['Id']}
+    res_meta = None
+
+    while True:
+        query_res = client.get_statement_result(**result_kwargs)
+        if res_meta is None:
+            res_meta = query_res['ColumnMetadata']
+            res_content = [[] for _ in res_meta]
+
+        metrics_start = time.perf_counter() if metricsEnabled() else None
+        # transpose the page once and read each column with its own value field
+        for res_values, res_column, res_cells in zip(res_content, res_meta, zip(*query_res['Records'])):
+            value_field = REDSHIFT_TYPES.get(res_column['typeName'], (None, None))[0]
+            if value_field is None:
+                res_values.extend(None if res_cell.get('isNull') else next(iter(res_cell.values())) for res_cell in res_cells)
+            else:
+                res_values.extend(res_cell.get(value_field) for res_cell in res_cells)
+
+        if metrics_start is not None:
+            emit('normalize', {'name': 'redshift/result'}, seconds=time.perf_counter() - metrics_start, rows=len(query_res['Records']))
+
+        if query_res.get('NextToken'):
+            logging.info('SDK [AWS | REDSHIFT]: Getting next page of results')
+            result_kwargs['NextToken'] = query_res['NextToken']
+        else:
+            break
 
-    res_col = []
-    for column in query_res['ColumnMetadata']:
-        res_col.append(column['name'])
+    metrics_start = time.perf_counter() if metricsEnabled() else None
+    query_df = pd.DataFrame({
+        res_cnt: _redshiftColumn(res_column['typeName'], res_values)
+        for res_cnt, (res_column, res_values) in enumerate(zip(res_meta, res_content))
+    })
+    query_df.columns = [res_column['name'] for res_column in res_meta]
 
-    res_content = []
-    for ent_row in query_res['Records']:
-        ent_content = []
-        for ent_col in ent_row:
-            ent_content.append(list(ent_col.values())[0])
+    if metrics_start is not None:
+        emit('frame', {'name': 'redshift/result'}, seconds=time.perf_counter() - metrics_start, rows=len(query_df))
+    return query_df
 
-        res_content.append(ent_content)
+# ¡--- Build a typed column out of the raw values of a redshift column ---!
+def _redshiftColumn(type_name, res_values):
+    column_type = REDSHIFT_TYPES.get(type_name, (None, 'object'))[1]
 
-    query_df = pd.DataFrame(columns=res_col, data=res_content)
+    if column_type == 'numeric':
+        return pd.to_numeric(pd.Series(res_values, dtype='object'))
+    elif column_type == 'datetime':
+        return pd.to_datetime(pd.Series(res_values, dtype='object'))
+    elif column_type == 'datetimetz':
+        return pd.to_datetime(pd.Series(res_values, dtype='object'), utc=True)
 
-    return query_df
\ No newline at end of file
+    return pd.Series(pd.array(res_values, dtype=column_type))
@@ -6,18 +6,21 @@
 #
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
-import json
 import logging
-import requests as rq
-import pandas as pd
 
-class Bamboo:
+from api_cache import cachedGet
+from api_flatten import Flattener, checkFormat, emptyResult
+from api_metrics import pageJson
+from api_registry import ConnectorRegistry, loadCredentials
+from api_transport import getTransport
+
+class Bamboo(metaclass=ConnectorRegistry):
     # ¡--- Initiate an instance to BambooHR with the given credentials (set headers and auth) ---!
     # - https://documentation.bamboohr.com/docs
     # - Requires: the path of the json file with the necessary login credentials
-    def __init__(self, credentials_path):
-        with open(credentials_path, 'r') as credentials_file:
-            credentials_items = json.load(credentials_file)
+    # - Optional: a response cache (api_cache.ResponseCache), it can be shared with the other connectors
+    def __init__(self, credentials_path, response_cache=None):
+        credentials_items = loadCredentials(credentials_path)
         logging.critical('API [bamboohr][aux]: Credentials read successfully')
 
         self.url_base = credentials_items['base_url'] + credentials_items['subdomain']
@@ -26,26 +29,31 @@ class Bamboo:
         }
         self.authorization = (credentials_items['api_key'], 'pass')
 
+        self.transport = getTransport()
+        self.response_cache = response_cache
         logging.critical('API [bamboohr][aux]: Headers and authorization set successfully')
 
     # ¡--- Get the current employee directory ---!
     # - https://documentation.bamboohr.com/reference/get-employees-directory-1
-    # - Requires: n/a
-    def getEmployeesDirectory(self):
+    # - Optional: the result format (pandas, records, arrow)
+    def getEmployeesDirectory(self, request_format='pandas'):
+        checkFormat(request_format)
         url_endpoint = '/v1/employees/directory'
 
         logging.info('API [bamboohr][get | employees/directory]: Sending initial request')
-        employees_directory_response = rq.get(
-            url     = self.url_base + url_endpoint,
+        employees_directory_response = cachedGet(
+            self.response_cache, self.transport, self.url_base + url_endpoint, 'bamboohr/employees/directory',
             headers = self.headers,
             auth    = self.authorization
         )
 
         if employees_directory_response.status_code == 200:
             logging.info('API [bamboohr][get | employees/directory]: Request successful, converting results')
-            employees_directory_response = pd.json_normalize(employees_directory_response.json()['employees'])
+            employees_directory_flattener = Flattener(metric_name='bamboohr/employees/directory')
+            employees_directory_flattener.extend(pageJson(employees_directory_response, 'bamboohr/employees/directory')['employees'])
+            employees_directory_response = employees_directory_flattener.toOutput(request_format)
         else:
             logging.error('API: [harvest][get | employees/directory]: Could not complete request')
-            employees_directory_response = pd.DataFrame()
+            employees_directory_response = emptyResult(request_format)
 
         return employees_directory_response
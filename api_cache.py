@@ -0,0 +1,188 @@
+# ====================================================================================================
+# Persistent and response caches shared by the connectors
+#
+# Documentation:
+#     - os.replace (atomic writes) : https://docs.python.org/3/library/os.html#os.replace
+#     - conditional requests       : https://www.rfc-editor.org/rfc/rfc9110#name-conditional-requests
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from api_metrics import pageJson
+from collections import OrderedDict
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
+
+# Response headers kept next to the payload (revalidation and pagination)
+CACHE_HEADERS = ('ETag', 'Last-Modified', 'Link')
+
+class DiskCache:
+    # ¡--- Initiate an on-disk cache of json payloads ---!
+    # - Requires: the directory where the entries are kept (created when missing, ~ is expanded)
+    # - Optional: keep the directory private to the current user (0700), meant for secrets like session tokens
+    # - The entries are always written with 0600 permissions (tempfile.mkstemp)
+    def __init__(self, cache_dir, private=False):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, mode=0o700 if private else 0o777, exist_ok=True)
+        if private:
+            os.chmod(self.cache_dir, 0o700)
+
+    # ¡--- Get the payload stored for a key (None when it isn't cached) ---!
+    def get(self, cache_key):
+        try:
+            with open(self._path(cache_key), 'r') as cache_file:
+                cache_entry = json.load(cache_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # the key is stored next to the payload to rule out hash collisions
+        if cache_entry.get('key') != cache_key:
+            return None
+
+        logging.info(f'API [cache][disk]: Entry found ({cache_key})')
+        return cache_entry['payload']
+
+    # ¡--- Store the payload of a key, the file is replaced atomically so readers never see partial entries ---!
+    def set(self, cache_key, cache_payload):
+        cache_fd, cache_tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(cache_fd, 'w') as cache_file:
+                json.dump({'key': cache_key, 'payload': cache_payload}, cache_file)
+            os.replace(cache_tmp, self._path(cache_key))
+        except BaseException:
+            os.remove(cache_tmp)
+            raise
+
+    # ¡--- Remove the entry of a key ---!
+    def delete(self, cache_key):
+        try:
+            os.remove(self._path(cache_key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, cache_key):
+        return os.path.join(self.cache_dir, hashlib.sha256(cache_key.encode('utf-8')).hexdigest() + '.json')
+
+class CachedResponse:
+    # ¡--- Response served from the cache, it mimics the parts of requests.Response used by the connectors ---!
+    # - The payload is kept parsed, json() returns it without decoding the body again
+    def __init__(self, cache_entry):
+        self.status_code = 200
+        self.from_cache = True
+        self.headers = CaseInsensitiveDict(cache_entry['headers'])
+        self._payload = cache_entry['payload']
+
+    def json(self):
+        return self._payload
+
+    @property
+    def links(self):
+        response_links = {}
+        for link_ent in parse_header_links(self.headers.get('Link', '')):
+            response_links[link_ent.get('rel') or link_ent.get('url')] = link_ent
+
+        return response_links
+
+class ResponseCache:
+    # ¡--- Initiate a response cache with an in-memory lru layer and an optional on-disk layer ---!
+    # - Optional: the directory of the on-disk layer, the amount of entries kept in memory, the default ttl (in seconds)
+    #   and a dictionary of ttl per endpoint (e.g. {'bamboohr/employees/directory': 3600})
+    # - Expired entries are revalidated with If-None-Match / If-Modified-Since when the vendor sent ETag / Last-Modified
+    def __init__(self, cache_dir=None, max_entries=128, ttl=300, endpoint_ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.endpoint_ttl = dict(endpoint_ttl or {})
+        self.disk_cache = DiskCache(cache_dir) if cache_dir is not None else None
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    # ¡--- Send a GET request through the transport unless a fresh entry is cached ---!
+    # - Requires: the transport, the url and the endpoint name (used to pick the ttl), any other keyword is passed to requests
+    # - Returns a CachedResponse on hits and successful requests, the transport response otherwise
+    def get(self, transport, url, cache_endpoint, **kwargs):
+        cache_key = self._key(url, kwargs)
+        cache_entry = self._read(cache_key)
+
+        if cache_entry is not None:
+            if time.time() - cache_entry['stored'] < self.endpoint_ttl.get(cache_endpoint, self.ttl):
+                logging.info(f'API [cache][{cache_endpoint}]: Fresh entry found, skipping request')
+                return CachedResponse(cache_entry)
+
+            cache_headers = dict(kwargs.get('headers') or {})
+            if cache_entry['headers'].get('ETag'):
+                cache_headers['If-None-Match'] = cache_entry['headers']['ETag']
+            if cache_entry['headers'].get('Last-Modified'):
+                cache_headers['If-Modified-Since'] = cache_entry['headers']['Last-Modified']
+            kwargs = {**kwargs, 'headers': cache_headers}
+
+        response = transport.get(url, **kwargs)
+
+        if response.status_code == 304 and cache_entry is not None:
+            logging.info(f'API [cache][{cache_endpoint}]: Entry not modified, reusing payload')
+            cache_entry = {**cache_entry, 'stored': time.time()}
+        elif response.status_code == 200:
+            cache_entry = {
+                'payload'   : pageJson(response, cache_endpoint),
+                'headers'   : {header_name: response.headers[header_name] for header_name in CACHE_HEADERS if header_name in response.headers},
+                'stored'    : time.time()
+            }
+        else:
+            return response
+
+        self._write(cache_key, cache_entry)
+        return CachedResponse(cache_entry)
+
+    # ¡--- Drop every entry kept in memory (the on-disk layer is kept) ---!
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    # ¡--- Key of a request, the credentials are part of it so tenants sharing a url never share entries ---!
+    def _key(self, url, kwargs):
+        key_headers = sorted((kwargs.get('headers') or {}).items())
+        key_source = json.dumps([url, key_headers, kwargs.get('params'), repr(kwargs.get('auth'))], default=repr)
+
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def _read(self, cache_key):
+        with self._lock:
+            if cache_key in self._memory:
+                self._memory.move_to_end(cache_key)
+                return self._memory[cache_key]
+
+        if self.disk_cache is None:
+            return None
+
+        cache_entry = self.disk_cache.get(cache_key)
+        if cache_entry is not None:
+            self._remember(cache_key, cache_entry)
+
+        return cache_entry
+
+    def _write(self, cache_key, cache_entry):
+        self._remember(cache_key, cache_entry)
+        if self.disk_cache is not None:
+            self.disk_cache.set(cache_key, cache_entry)
+
+    def _remember(self, cache_key, cache_entry):
+        with self._lock:
+            self._memory[cache_key] = cache_entry
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+# ¡--- Send a GET request through the response cache when there is one, or straight through the transport ---!
+# - Requires: the response cache (or None), the transport, the url and the endpoint name, any other keyword is passed to requests
+def cachedGet(response_cache, transport, url, cache_endpoint, **kwargs):
+    if response_cache is None:
+        return transport.get(url, **kwargs)
+
+    return response_cache.get(transport, url, cache_endpoint, **kwargs)
@@ -0,0 +1,218 @@
+# ====================================================================================================
+# Flattener of nested json records into compact data-frame columns (replaces per-page pd.json_normalize)
+#
+# Documentation:
+#     - pandas (nullable dtypes) : https://pandas.pydata.org/docs/user_guide/integer_na.html
+#     - pandas (categoricals)    : https://pandas.pydata.org/docs/user_guide/categorical.html
+#     - pyarrow (arrays/tables)  : https://arrow.apache.org/docs/python/generated/pyarrow.array.html
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import datetime
+import time
+
+from api_lazy import lazyImport
+from api_metrics import emit, metricsEnabled
+
+pa = lazyImport('pyarrow')
+pd = lazyImport('pandas')
+
+# Result formats of the getters: data-frame, plain records (dictionaries) or a pyarrow table
+REQUEST_FORMATS = ['pandas', 'records', 'arrow']
+
+# ¡--- Check that a result format is known before any request is sent ---!
+def checkFormat(request_format):
+    if request_format not in REQUEST_FORMATS:
+        raise ValueError(f'request_format must be one of: {REQUEST_FORMATS}')
+
+    return request_format
+
+# ¡--- Empty result in the given format (for the requests that could not be completed) ---!
+def emptyResult(request_format):
+    return Flattener().toOutput(request_format)
+
+class Flattener:
+    # ¡--- Initiate a flattener, the field paths are compiled into an extraction tree once and reused for every page ---!
+    # - Optional: a list of the field paths to extract (e.g. ['id', 'client.name']), every other field is skipped
+    #   while extracting, when not given the paths are discovered from the records (like pd.json_normalize)
+    # - Optional: the separator used for the column names, the paths to keep as categoricals and the paths to parse as datetimes
+    # - Optional: the name reported to the instrumentation hooks (api_metrics), e.g. harvest/time_entries
+    # - Null nested objects leave their child columns null (pd.json_normalize would add an extra column for them)
+    def __init__(self, request_fields=None, separator='.', categories=(), datetimes=(), metric_name='records'):
+        self.metric_name = metric_name
+        self.separator = separator
+        self.categories = set(categories)
+        self.datetimes = set(datetimes)
+        self.fixed = bool(request_fields)
+
+        self.paths = [tuple(field_path.split('.')) for field_path in request_fields] if self.fixed else []
+        self.columns = {field_path: [] for field_path in self.paths}
+        self.rows = 0
+        self._compile()
+
+    # ¡--- Append the records of a page into the column buffers ---!
+    # - Requires: a list of records (dictionaries)
+    # - A record with fields that aren't compiled yet rolls back its partial row, extends the paths and is extracted again
+    def extend(self, records):
+        metrics_start = time.perf_counter() if metricsEnabled() else None
+
+        for record_ent in records:
+            if not self._extract(self._tree, record_ent):
+                for column_values in self.columns.values():
+                    del column_values[self.rows:]
+                self._discover(record_ent, ())
+                self._compile()
+                self._extract(self._tree, record_ent)
+            self.rows += 1
+
+        if metrics_start is not None:
+            emit('normalize', {'name': self.metric_name}, seconds=time.perf_counter() - metrics_start, rows=len(records))
+
+    # ¡--- Build a data-frame with compact dtypes out of the column buffers ---!
+    # - Nullable integers and booleans, categoricals and parsed datetimes, the rest is inferred by pandas
+    def toFrame(self):
+        metrics_start = time.perf_counter() if metricsEnabled() else None
+        flatten_result = pd.DataFrame(
+            {self.separator.join(field_path): self._column(field_path) for field_path in self.paths},
+            index = pd.RangeIndex(self.rows)
+        )
+
+        if metrics_start is not None:
+            emit('frame', {'name': self.metric_name}, seconds=time.perf_counter() - metrics_start, rows=self.rows)
+        return flatten_result
+
+    # ¡--- Plain records (one dictionary per row, keyed by the column names) out of the column buffers ---!
+    # - The values are kept as they came in the json, pandas is never imported
+    def toRecords(self):
+        if not self.paths:
+            return [{} for _ in range(self.rows)]
+
+        column_names = [self.separator.join(field_path) for field_path in self.paths]
+        return [dict(zip(column_names, row_values)) for row_values in zip(*(self.columns[field_path] for field_path in self.paths))]
+
+    # ¡--- Build a pyarrow table straight out of the column buffers (no data-frame in between) ---!
+    # - Categoricals become dictionary arrays and datetimes timestamps, table.to_pandas() gives back the data-frame
+    def toArrow(self):
+        metrics_start = time.perf_counter() if metricsEnabled() else None
+        flatten_result = pa.table({self.separator.join(field_path): self._arrowColumn(field_path) for field_path in self.paths})
+
+        if metrics_start is not None:
+            emit('frame', {'name': self.metric_name}, seconds=time.perf_counter() - metrics_start, rows=self.rows)
+        return flatten_result
+
+    # ¡--- Result in the given format (pandas, records, arrow) ---!
+    def toOutput(self, request_format='pandas'):
+        checkFormat(request_format)
+        if request_format == 'records':
+            return self.toRecords()
+        elif request_format == 'arrow':
+            return self.toArrow()
+
+        return self.toFrame()
+
+    # ¡--- Build the data-frame and empty the buffers, the compiled paths are kept for the next chunk ---!
+    def drain(self):
+        flatten_result = self.toFrame()
+        self.columns = {field_path: [] for field_path in self.paths}
+        self.rows = 0
+        self._compile()
+
+        return flatten_result
+
+    # ¡--- Typed column of a field path ---!
+    def _column(self, field_path):
+        column_values = self.columns[field_path]
+        column_name = '.'.join(field_path)
+
+        if column_name in self.datetimes:
+            return pd.to_datetime(pd.Series(column_values, dtype='object'), errors='coerce')
+        elif column_name in self.categories:
+            return pd.Categorical(column_values)
+
+        try:
+            return pd.array(column_values)
+        except (TypeError, ValueError):
+            return pd.array(column_values, dtype='object')
+
+    # ¡--- Typed arrow array of a field path, columns with mixed types are kept as strings ---!
+    def _arrowColumn(self, field_path):
+        column_values = self.columns[field_path]
+        column_name = '.'.join(field_path)
+
+        if column_name in self.datetimes:
+            column_values = [self._datetime(column_value) for column_value in column_values]
+
+        try:
+            column_array = pa.array(column_values)
+        except (TypeError, ValueError):
+            column_array = pa.array([None if column_value is None else str(column_value) for column_value in column_values], type=pa.string())
+
+        return column_array.dictionary_encode() if column_name in self.categories else column_array
+
+    # ¡--- Parse an iso-8601 value (None when it can't be parsed, like pd.to_datetime with errors='coerce') ---!
+    def _datetime(self, column_value):
+        try:
+            return datetime.datetime.fromisoformat(column_value)
+        except (TypeError, ValueError):
+            return None
+
+    # ¡--- Register the paths of a record that aren't known yet (returns True when the schema changed) ---!
+    def _discover(self, record_value, record_path):
+        schema_changed = False
+
+        for record_key, record_ent in record_value.items():
+            field_path = record_path + (record_key,)
+            if isinstance(record_ent, dict) and record_ent:
+                schema_changed = self._discover(record_ent, field_path) or schema_changed
+            elif field_path not in self.columns and not any(known_path[:len(field_path)] == field_path for known_path in self.paths):
+                # backfill the rows that were extracted before the path showed up
+                self.paths.append(field_path)
+                self.columns[field_path] = [None] * self.rows
+                schema_changed = True
+
+        return schema_changed
+
+    # ¡--- Compile the paths into a tree of (leaves, children, keys, appends) nodes ---!
+    def _compile(self):
+        self._tree = self._node([(field_path, self.columns[field_path].append) for field_path in self.paths])
+
+    def _node(self, node_paths):
+        node_leaves, node_children = {}, {}
+        for field_path, field_append in node_paths:
+            if len(field_path) == 1:
+                node_leaves[field_path[0]] = field_append
+            else:
+                node_children.setdefault(field_path[0], []).append((field_path[1:], field_append))
+
+        # a key can be both a leaf (when its value was null or scalar) and a nested object
+        return (
+            [(node_key, field_append) for node_key, field_append in node_leaves.items() if node_key not in node_children],
+            [(node_key, self._node(child_paths), node_leaves.get(node_key)) for node_key, child_paths in node_children.items()],
+            set(node_leaves) | set(node_children),
+            [field_append for _, field_append in node_paths]
+        )
+
+    # ¡--- Walk a record through the compiled tree, appending a value (or None) to every column ---!
+    # - Returns False as soon as the record has a field that isn't compiled (never when the fields are fixed)
+    def _extract(self, node, record_value):
+        if type(record_value) is not dict:
+            for field_append in node[3]:
+                field_append(None)
+            return True
+        elif not self.fixed and not record_value.keys() <= node[2]:
+            return False
+
+        for node_key, field_append in node[0]:
+            field_value = record_value.get(node_key)
+            if type(field_value) is dict and field_value and not self.fixed:
+                return False
+            field_append(field_value)
+
+        for node_key, child_node, field_append in node[1]:
+            child_value = record_value.get(node_key)
+            if field_append is not None:
+                field_append(None if type(child_value) is dict else child_value)
+            if not self._extract(child_node, child_value):
+                return False
+
+        return True
@@ -7,18 +7,23 @@
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
 import base64
-import json
 import logging
-import requests as rq
-import pandas as pd
 
-class Greenhouse:
+from api_cache import cachedGet
+from api_flatten import Flattener, checkFormat, emptyResult
+from api_metrics import pageJson
+from api_registry import ConnectorRegistry, loadCredentials
+from api_transport import getTransport
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+class Greenhouse(metaclass=ConnectorRegistry):
     # ¡--- Initiate an instance to Harvest(Greenhouse) with the given credentials (set headers and auth) ---!
     # - https://developers.greenhouse.io/harvest.html#authentication
     # - Requires: the path of the json file with the necessary login credentials
-    def __init__(self, credentials_path):
-        with open(credentials_path, 'r') as credentials_file:
-            credentials_items = json.load(credentials_file)
+    # - Optional: a response cache (api_cache.ResponseCache), it can be shared with the other connectors
+    def __init__(self, credentials_path, response_cache=None):
+        credentials_items = loadCredentials(credentials_path)
         logging.critical('API [greenhouse][aux]: Credentials read successfully')
 
         self.url_base = credentials_items['base_url']
@@ -28,26 +33,76 @@ class Greenhouse:
             'Authorization' : f'Basic {self.authorization.decode("utf-8")}',
             'Accept'        : 'application/json'
         }
+        self.transport = getTransport()
+        self.response_cache = response_cache
         logging.critical('API [greenhouse][aux]: Headers and authorization set successfully')
 
 
     # ¡--- Get the current list of jobs ---!
     # - https://developers.greenhouse.io/harvest.html#get-list-jobs
-    # - Requires: n/a
-    def getJobsList(self):
-        url_endpoint = self.url_base + 'jobs?per_page=500'
+    # - https://developers.greenhouse.io/harvest.html#pagination
+    # - Optional: only return jobs updated or created after the given timestamp (ISO-8601)
+    # - Optional: the maximum number of pages fetched at the same time
+    # - Optional: the result format (pandas, records, arrow)
+    def getJobsList(self, request_updated_after=None, request_created_after=None, request_workers=4, request_format='pandas'):
+        checkFormat(request_format)
+        url_endpoint = self.url_base + 'jobs?' + urlencode({
+            url_key: url_value for url_key, url_value in [
+                ('per_page', 500), ('updated_after', request_updated_after), ('created_after', request_created_after)
+            ] if url_value is not None
+        })
 
         logging.info('API [greenhouse][get | jobs]: Sending initial request')
-        jobs_list_result = rq.get(
-            url     = url_endpoint,
+        jobs_list_result = cachedGet(
+            self.response_cache, self.transport, url_endpoint, 'greenhouse/jobs',
             headers = self.headers
         )
 
-        if jobs_list_result.status_code == 200:
-            logging.info('API [greenhouse][get | jobs]: Request successful, converting results')
-            jobs_list_result = pd.json_normalize(jobs_list_result.json())
-        else:
+        if jobs_list_result.status_code != 200:
             logging.error('API [greenhouse][get | jobs]: Couldn\'t complete request')
-            jobs_list_result = pd.DataFrame()
+            return emptyResult(request_format)
+
+        jobs_list_pages = [pageJson(jobs_list_result, 'greenhouse/jobs')]
+        jobs_list_links = jobs_list_result.links
+
+        # the Link header exposes the last page, the rest of the pages are fetched at the same time
+        if 'last' in jobs_list_links:
+            page_last = int(parse_qs(urlsplit(jobs_list_links['last']['url']).query)['page'][0])
+            logging.info(f'API [greenhouse][get | jobs]: Initial request successful, getting [{page_last - 1}] additional pages')
+            with ThreadPoolExecutor(max_workers=max(1, request_workers)) as page_pool:
+                jobs_list_pages.extend(page_pool.map(
+                    lambda page_cnt: self._getJobsPage(f'{url_endpoint}&page={page_cnt}', page_cnt, page_last),
+                    range(2, page_last + 1)
+                ))
+
+        # otherwise follow the next links one after the other
+        else:
+            while 'next' in jobs_list_links and jobs_list_pages[-1] is not None:
+                jobs_list_result = cachedGet(
+                    self.response_cache, self.transport, jobs_list_links['next']['url'], 'greenhouse/jobs',
+                    headers = self.headers
+                )
+                jobs_list_pages.append(pageJson(jobs_list_result, 'greenhouse/jobs') if jobs_list_result.status_code == 200 else None)
+                jobs_list_links = jobs_list_result.links
+
+        if any(jobs_list_page is None for jobs_list_page in jobs_list_pages):
+            logging.error('API [greenhouse][get | jobs]: Couldn\'t complete every page request')
+            return emptyResult(request_format)
+
+        logging.info('API [greenhouse][get | jobs]: Request successful, converting results')
+        jobs_list_flattener = Flattener(metric_name='greenhouse/jobs')
+        for jobs_list_page in jobs_list_pages:
+            jobs_list_flattener.extend(jobs_list_page)
+
+        return jobs_list_flattener.toOutput(request_format)
+
+    # ¡--- Get a single page of jobs (None when the request fails) ---!
+    # - Requires: the url of the page, the page number and the last page
+    def _getJobsPage(self, url_page, page_cnt, page_last):
+        logging.info(f'API [greenhouse][get | jobs]: Getting results for page [{page_cnt} | {page_last}]')
+        jobs_page_result = cachedGet(
+            self.response_cache, self.transport, url_page, 'greenhouse/jobs',
+            headers = self.headers
+        )
 
-        return jobs_list_result
\ No newline at end of file
+        return pageJson(jobs_page_result, 'greenhouse/jobs') if jobs_page_result.status_code == 200 else None
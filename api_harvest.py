@@ -6,19 +6,54 @@
 #
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
-import json
+import datetime
 import logging
-import re
-import requests as rq
-import pandas as pd
 
-class Harvest:
+from api_cache import DiskCache
+from api_flatten import Flattener, checkFormat, emptyResult
+from api_lazy import lazyImport
+from api_metrics import pageJson
+from api_registry import ConnectorRegistry, loadCredentials
+from api_state import SyncStore
+from api_stream import rechunkRecords
+from api_transport import getTransport
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlencode
+
+pd = lazyImport('pandas')
+
+# Documented fields of the time entries, they fix the columns of iterTimeEntries so every chunk has the same ones
+# - https://help.getharvest.com/api-v2/timesheets-api/timesheets/time-entries/#the-time-entry-object
+TIME_ENTRIES_FIELDS = [
+    'id', 'spent_date',
+    'user.id', 'user.name',
+    'user_assignment.id', 'user_assignment.is_project_manager', 'user_assignment.is_active', 'user_assignment.use_default_rates',
+    'user_assignment.budget', 'user_assignment.created_at', 'user_assignment.updated_at', 'user_assignment.hourly_rate',
+    'client.id', 'client.name', 'client.currency',
+    'project.id', 'project.name', 'project.code',
+    'task.id', 'task.name',
+    'task_assignment.id', 'task_assignment.billable', 'task_assignment.is_active', 'task_assignment.created_at',
+    'task_assignment.updated_at', 'task_assignment.hourly_rate', 'task_assignment.budget',
+    'external_reference.id', 'external_reference.group_id', 'external_reference.account_id', 'external_reference.permalink',
+    'external_reference.service', 'external_reference.service_icon_url',
+    'invoice.id', 'invoice.number',
+    'hours', 'hours_without_timer', 'rounded_hours', 'notes', 'is_locked', 'locked_reason', 'approval_status', 'is_closed',
+    'is_billed', 'timer_started_at', 'started_time', 'ended_time', 'is_running', 'billable', 'budgeted', 'billable_rate',
+    'cost_rate', 'created_at', 'updated_at',
+]
+
+# Low-cardinality and datetime fields of the time entries, kept as categoricals and parsed datetimes
+TIME_ENTRIES_CATEGORIES = ['user.name', 'client.name', 'client.currency', 'project.name', 'project.code', 'task.name']
+TIME_ENTRIES_DATETIMES = ['spent_date', 'created_at', 'updated_at', 'timer_started_at']
+
+class Harvest(metaclass=ConnectorRegistry):
     # ¡--- Initiate an instance to Harvest with the given credentials (set the headers) ---!
     # - https://help.getharvest.com/api-v2/authentication-api/authentication/authentication/
     # - Requires: the path of the json file with the necessary login credentials
     def __init__(self, credentials_path):
-        with open(credentials_path, 'r') as credentials_file:
-            credentials_items = json.load(credentials_file)
+        credentials_items = loadCredentials(credentials_path)
         logging.critical('API [harvest][aux]: Credentials read successfully')
 
         self.credentials = {
@@ -28,60 +63,185 @@ class Harvest:
         }
         self.url_base = 'https://api.harvestapp.com/v2/'
 
+        self.transport = getTransport()
+
         logging.critical('API [harvest][headers]: Headers set successfully')
 
     # ¡--- Get the list of tasks worked on with ina given time period
     # - https://help.getharvest.com/api-v2/timesheets-api/timesheets/time-entries/
     # - Requires: a valid start and end date in YYYYMMDD format
     # - Optional: a list with the required fields to return
-    def getTimeEntries(self, request_start, request_end, request_fields=[]):
+    # - Optional: the maximum number of pages fetched at the same time (keep it under Harvest's rate limit)
+    # - Optional: the result format (pandas, records, arrow)
+    def getTimeEntries(self, request_start, request_end, request_fields=[], request_workers=4, request_format='pandas'):
+        checkFormat(request_format)
         logging.info('API [harvest][get | time_entries]: Sending initial request')
         time_entries_url = f'{self.url_base}time_entries?from={request_start}&to={request_end}'
-        time_entries_call = rq.get(time_entries_url, headers=self.credentials)
+        time_entries_json = self._getTimeEntriesFirst(time_entries_url)
 
-        if time_entries_call.status_code == 200:
-            logging.info('API [harvest][get | time_entries]: Initial request successful, getting paginated results')
-            time_entries_result = pd.json_normalize(time_entries_call.json()['time_entries']) 
-            page_last = time_entries_call.json()['links']['last']
-            page_last = int(re.findall('&page=(\d+)', page_last)[0])
+        if time_entries_json is not None:
+            time_entries_flattener = self._flattenTimeEntries(request_fields)
+            for page_records in self._iterTimeEntriesPages(time_entries_url, time_entries_json, request_workers):
+                time_entries_flattener.extend(page_records)
+            time_entries_result = time_entries_flattener.toOutput(request_format)
+
+        else:
+            time_entries_result = emptyResult(request_format)
+
+        return time_entries_result
+
+    # ¡--- Iterate over the tasks worked on within a given time period, one data-frame chunk at a time ---!
+    # - https://help.getharvest.com/api-v2/timesheets-api/timesheets/time-entries/
+    # - Requires: a valid start and end date in YYYYMMDD format
+    # - Optional: a list with the required fields to return, the documented ones by default (TIME_ENTRIES_FIELDS)
+    # - Optional: the maximum number of pages fetched at the same time (keep it under Harvest's rate limit)
+    # - Optional: the amount of rows per chunk, when not given every page is its own chunk
+    # - Only the pages in flight and the current chunk are held in memory, see api_stream.writeChunks to persist them
+    # - The fields are never discovered while streaming, every chunk has the same columns even when a later page is
+    #   the first one with e.g. an invoice (fields that aren't listed are skipped)
+    def iterTimeEntries(self, request_start, request_end, request_fields=[], request_workers=4, request_chunk=None):
+        logging.info('API [harvest][iter | time_entries]: Sending initial request')
+        time_entries_url = f'{self.url_base}time_entries?from={request_start}&to={request_end}'
+        time_entries_json = self._getTimeEntriesFirst(time_entries_url)
 
-            for page_cnt in range(2, page_last):
-                logging.info(f'API [harvest | time_entries]: Getting results for page [{page_cnt} | {page_last - 1}]')
-                page_call = rq.get(
-                    f'{time_entries_url}&page={page_cnt}',
-                    headers = self.credentials
-                )
+        if time_entries_json is not None:
+            time_entries_flattener = self._flattenTimeEntries(request_fields or TIME_ENTRIES_FIELDS)
+            time_entries_pages = self._iterTimeEntriesPages(time_entries_url, time_entries_json, request_workers)
+            for chunk_records in rechunkRecords(time_entries_pages, request_chunk):
+                time_entries_flattener.extend(chunk_records)
+                yield time_entries_flattener.drain()
 
-                page_call = pd.json_normalize(page_call.json()['time_entries'])
-                time_entries_result = pd.concat([time_entries_result, page_call])
+    # ¡--- Sync the time entries changed since the last run into a local store ---!
+    # - https://help.getharvest.com/api-v2/timesheets-api/timesheets/time-entries/ (updated_since)
+    # - Requires: the path of the sqlite file that keeps the synced entries (see api_state.SyncStore)
+    # - Optional: a valid start and end date in YYYYMMDD format, every window keeps its own high-water mark
+    # - Optional: a list with the required fields to return
+    # - Optional: the maximum number of pages fetched at the same time (keep it under Harvest's rate limit)
+    # - Returns only the new or changed entries, the first run for a window is a full pull
+    # - The entries and the high-water mark are only stored once every page was received (a single transaction),
+    #   a failed run leaves the local copy untouched and is fully repeated by the next one
+    # - Entries deleted in Harvest are not reported by updated_since and remain in the local copy
+    def syncTimeEntries(self, store_path, request_start=None, request_end=None, request_fields=[], request_workers=4):
+        sync_resource = self._syncResource(request_start, request_end)
+        time_entries_flattener = self._flattenTimeEntries(request_fields)
 
-            if any(request_fields) == True:
-                time_entries_result = time_entries_result[request_fields]
-            time_entries_result = time_entries_result.reset_index(drop=True)
-            time_entries_result.columns = time_entries_result.columns.str.replace('.', '_')
+        with SyncStore(store_path) as sync_store:
+            sync_watermark = sync_store.getWatermark(sync_resource)
+            time_entries_url = f'{self.url_base}time_entries?' + urlencode({
+                sync_key: sync_value for sync_key, sync_value in [
+                    ('from', request_start), ('to', request_end), ('updated_since', sync_watermark)
+                ] if sync_value is not None
+            })
 
+            logging.info(f'API [harvest][sync | time_entries]: Sending initial request (updated since {sync_watermark})')
+            time_entries_json = self._getTimeEntriesFirst(time_entries_url)
+            if time_entries_json is None:
+                return []
+
+            sync_latest = sync_watermark
+            with sync_store.transaction():
+                for page_records in self._iterTimeEntriesPages(time_entries_url, time_entries_json, request_workers):
+                    time_entries_flattener.extend(sync_store.upsertRecords(sync_resource, page_records))
+                    for page_record in page_records:
+                        if page_record.get('updated_at') is not None and (sync_latest is None or page_record['updated_at'] > sync_latest):
+                            sync_latest = page_record['updated_at']
+                sync_store.setWatermark(sync_resource, sync_latest)
+
+        logging.info(f'API [harvest][sync | time_entries]: [{time_entries_flattener.rows}] new or changed entries synced')
+        return time_entries_flattener.toFrame()
+
+    # ¡--- Get the full local copy of the synced time entries (no requests are sent) ---!
+    # - Requires: the path of the sqlite file used by syncTimeEntries
+    # - Optional: the same start and end date used by syncTimeEntries, and a list with the required fields to return
+    def snapshotTimeEntries(self, store_path, request_start=None, request_end=None, request_fields=[]):
+        with SyncStore(store_path) as sync_store:
+            time_entries_records = sync_store.getRecords(self._syncResource(request_start, request_end))
+
+        time_entries_flattener = self._flattenTimeEntries(request_fields)
+        time_entries_flattener.extend(time_entries_records)
+
+        return time_entries_flattener.toFrame()
+
+    # ¡--- Name of the synced resource in the local store (one per account and time window) ---!
+    def _syncResource(self, request_start, request_end):
+        return f'harvest/{self.credentials["Harvest-Account-Id"]}/time_entries?from={request_start}&to={request_end}'
+
+    # ¡--- Send the first time entries request, it holds the link to the last page ---!
+    # - Requires: the time entries url with its filters
+    def _getTimeEntriesFirst(self, time_entries_url):
+        time_entries_call = self.transport.get(time_entries_url, headers=self.credentials)
+
+        if time_entries_call.status_code == 200:
+            logging.info('API [harvest][get | time_entries]: Initial request successful, getting paginated results')
+            time_entries_json = pageJson(time_entries_call, 'harvest/time_entries')
         else:
-            time_entries_result = []
+            time_entries_json = None
             logging.error('API [harvest][get | time_entries]: Could not complete request')
 
-        return time_entries_result
+        return time_entries_json
+
+    # ¡--- Yield the raw records of every time entries page, in page order ---!
+    # - Requires: the time entries url with its filters, the first page response and the amount of workers
+    # - The page count is read from total_pages, the links hold the filters in any order (page may come first)
+    # - The remaining pages are independent, they're fetched by a bounded pool that keeps at most
+    #   request_workers pages in flight ahead of the consumer
+    def _iterTimeEntriesPages(self, time_entries_url, time_entries_json, request_workers):
+        yield time_entries_json['time_entries']
+
+        page_last = time_entries_json['total_pages']
+        page_next = iter(range(2, page_last + 1))
+        request_workers = max(1, request_workers)
+
+        with ThreadPoolExecutor(max_workers=request_workers) as page_pool:
+            page_pending = deque(
+                page_pool.submit(self._getTimeEntriesPage, time_entries_url, page_cnt, page_last)
+                for page_cnt in islice(page_next, request_workers)
+            )
+            while page_pending:
+                page_records = page_pending.popleft().result()
+                for page_cnt in islice(page_next, 1):
+                    page_pending.append(page_pool.submit(self._getTimeEntriesPage, time_entries_url, page_cnt, page_last))
+                yield page_records
+
+    # ¡--- Get the raw records of a single page of time entries ---!
+    # - Requires: the time entries url with its filters, the page to retrieve and the last page
+    # - Raises a RuntimeError when the page still fails after the transport retries, so a partial result is never returned
+    def _getTimeEntriesPage(self, time_entries_url, page_cnt, page_last):
+        logging.info(f'API [harvest][get | time_entries]: Getting results for page [{page_cnt} | {page_last}]')
+        page_call = self.transport.get(
+            f'{time_entries_url}&page={page_cnt}',
+            headers = self.credentials
+        )
+
+        if page_call.status_code != 200:
+            logging.error(f'API [harvest][get | time_entries]: Could not complete request for page [{page_cnt} | {page_last}]')
+            raise RuntimeError(f'Harvest time_entries request failed with status {page_call.status_code} (page {page_cnt} of {page_last})')
+
+        return pageJson(page_call, 'harvest/time_entries')['time_entries']
+
+    # ¡--- Flattener of time entries, only the requested fields are extracted and the columns are named with '_' ---!
+    def _flattenTimeEntries(self, request_fields):
+        return Flattener(
+            request_fields  = request_fields,
+            separator       = '_',
+            categories      = TIME_ENTRIES_CATEGORIES,
+            datetimes       = TIME_ENTRIES_DATETIMES,
+            metric_name     = 'harvest/time_entries'
+        )
 
     # ¡--- Get the time report list of each client within a given time frame ---!
     # - https://help.getharvest.com/api-v2/reports-api/reports/time-reports/
     # - Requires: a valid time frame in YYYYMMDD date, with at most a 365 day time span
     # - Simple implementation of this endpoint, linked to the full version (getTimeReportClientsFull), can still be used separately
     def getTimeReportClientsSimple (self, request_start, request_end):
-        logging.info('API [harvest][get | reports/time/clients]: Sending request')
-        time_report_clients_url = f'{self.url_base}reports/time/clients?from={request_start}&to={request_end}'
-        time_report_clients_call = rq.get(time_report_clients_url, headers=self.credentials)
-
-        if time_report_clients_call.status_code == 200:
-            time_report_clients_result = pd.json_normalize(time_report_clients_call.json()['results'])
-            logging.info('API [harvest][get | reports/time/clients]: Request retrieved successfully')
+        time_report_clients_records = self._getTimeReportClientsRecords(request_start, request_end)
 
+        if time_report_clients_records is not None:
+            time_report_clients_flattener = Flattener(metric_name='harvest/reports/time/clients')
+            time_report_clients_flattener.extend(time_report_clients_records)
+            time_report_clients_result = time_report_clients_flattener.toFrame()
         else:
             time_report_clients_result = []
-            logging.error('API [harvest][get | reports/time/clients]: Could not complete request')
 
         return time_report_clients_result
 
@@ -90,8 +250,11 @@ class Harvest:
     #   - a valid start and end date as an arrow time object
     #   - a valid span type (month, year)
     #   - a request exact option dictionary for the start and end dates
-    # - Optional: a list of the required field to return
-    def getTimeReportClientsFull (self, request_start, request_end, request_span, request_exact, request_merge):
+    #   - a merge option, to sum every span into billable_hours or keep one billable_hours_<n> column per span
+    # - Optional: the maximum number of spans requested at the same time
+    # - Optional: a directory to cache the spans that already ended, they are never requested again
+    #   (remove the directory to refresh them, e.g. after late time entries for a closed period)
+    def getTimeReportClientsFull (self, request_start, request_end, request_span, request_exact, request_merge, request_workers=4, request_cache=None):
         request_span_valid = ['month', 'year']
         if request_span not in request_span_valid:
             raise ValueError(f'request_span must be one of: {request_span_valid}')
@@ -100,6 +263,7 @@ class Harvest:
 
         request_span = list(arrow.Arrow.span_range(request_span, request_start, request_end))
         request_span_total = len(request_span)
+        request_calls = []
 
         for time_span_cnt, time_span_ent in enumerate(request_span):
             logging.info(f'API [harvest][aux | reports/time/clients]: Setting properties for call [{time_span_cnt + 1} | {request_span_total}]')
@@ -115,35 +279,76 @@ class Harvest:
                 call_start   = time_span_ent[0]
                 call_end     = time_span_ent[1]
 
-            time_report_clients_ent = self.getTimeReportClientsSimple(
-                request_start = call_start.format('YYYYMMDD'), 
-                request_end = call_end.format('YYYYMMDD')
-            )
+            request_calls.append((call_start, call_end))
 
-            if time_span_cnt == 0:
-                time_report_clients_full = time_report_clients_ent.drop(columns=['total_hours',	'currency',	'billable_amount'])
-            else:
-                time_report_clients_full = pd.merge(
-                    time_report_clients_full,
-                    time_report_clients_ent[['client_id', 'client_name', 'billable_hours']],
-                    how='outer',
-                    on=['client_id', 'client_name']
-                ).fillna(0)
-
-                if request_merge == True:
-                    time_report_clients_full['billable_hours'] = time_report_clients_full['billable_hours_x'] + time_report_clients_full['billable_hours_y']
-                    time_report_clients_full = time_report_clients_full.drop(columns=['billable_hours_x', 'billable_hours_y'])
-                else:
-                    time_report_clients_full = time_report_clients_full.rename(
-                        columns={
-                            'billable_hours_x':f'billable_hours_{time_span_cnt}',
-                            'billable_hours_y':f'billable_hours_{time_span_cnt+1}',
-                        }
-                    )
+        # the spans are independent, request them at the same time and combine them once
+        report_cache = DiskCache(request_cache) if request_cache is not None else None
+        with ThreadPoolExecutor(max_workers=max(1, request_workers)) as span_pool:
+            span_records = list(span_pool.map(
+                lambda request_call: self._getTimeReportClientsSpan(request_call[0], request_call[1], report_cache),
+                request_calls
+            ))
+
+        if any(time_span_records is None for time_span_records in span_records):
+            logging.error('API [harvest][aux | reports/time/clients]: Could not complete every span request')
+            return []
+
+        time_report_clients_full = pd.concat([
+            pd.DataFrame(time_span_records, columns=['client_id', 'client_name', 'billable_hours']).assign(time_span=time_span_cnt + 1)
+            for time_span_cnt, time_span_records in enumerate(span_records)
+        ])
+
+        if request_merge == True or request_span_total == 1:
+            time_report_clients_full = time_report_clients_full.groupby(['client_id', 'client_name'], as_index=False)['billable_hours'].sum()
+        else:
+            time_report_clients_full = time_report_clients_full.pivot_table(
+                index       = ['client_id', 'client_name'],
+                columns     = 'time_span',
+                values      = 'billable_hours',
+                aggfunc     = 'sum',
+                fill_value  = 0
+            ).reindex(columns=range(1, request_span_total + 1), fill_value=0)
+            time_report_clients_full.columns = [f'billable_hours_{time_span_cnt}' for time_span_cnt in time_report_clients_full.columns]
+            time_report_clients_full = time_report_clients_full.reset_index()
         logging.info('API [harvest][aux | time/reports/clients]: Information gathered successfully')
 
         return time_report_clients_full
 
+    # ¡--- Get the raw client time report records of a time frame (None when the request fails) ---!
+    # - Requires: a valid time frame in YYYYMMDD date, with at most a 365 day time span
+    def _getTimeReportClientsRecords(self, request_start, request_end):
+        logging.info('API [harvest][get | reports/time/clients]: Sending request')
+        time_report_clients_url = f'{self.url_base}reports/time/clients?from={request_start}&to={request_end}'
+        time_report_clients_call = self.transport.get(time_report_clients_url, headers=self.credentials)
+
+        if time_report_clients_call.status_code == 200:
+            time_report_clients_records = pageJson(time_report_clients_call, 'harvest/reports/time/clients')['results']
+            logging.info('API [harvest][get | reports/time/clients]: Request retrieved successfully')
+
+        else:
+            time_report_clients_records = None
+            logging.error('API [harvest][get | reports/time/clients]: Could not complete request')
+
+        return time_report_clients_records
+
+    # ¡--- Get the raw records of a span, spans that already ended are read from (and kept in) the cache ---!
+    # - Requires: the start and end of the span as arrow time objects and the cache (or None)
+    def _getTimeReportClientsSpan(self, call_start, call_end, report_cache):
+        call_start, call_end = call_start.format('YYYYMMDD'), call_end.format('YYYYMMDD')
+        cache_key = f'harvest/{self.credentials["Harvest-Account-Id"]}/reports/time/clients?from={call_start}&to={call_end}'
+        cache_immutable = report_cache is not None and call_end < datetime.date.today().strftime('%Y%m%d')
+
+        if cache_immutable == True:
+            time_report_clients_records = report_cache.get(cache_key)
+            if time_report_clients_records is not None:
+                return time_report_clients_records
+
+        time_report_clients_records = self._getTimeReportClientsRecords(call_start, call_end)
+        if cache_immutable == True and time_report_clients_records is not None:
+            report_cache.set(cache_key, time_report_clients_records)
+
+        return time_report_clients_records
+
 # --------------------------------------------------------------------------------------
 # Change it so it also includes the total amount of hours, not just the billable ones
 # --------------------------------------------------------------------------------------
\ No newline at end of file
@@ -6,18 +6,23 @@
 #
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
-import json
 import logging
-import requests as rq
-import pandas as pd
 
-class Lattice:
+from api_cache import cachedGet
+from api_flatten import Flattener, checkFormat, emptyResult
+from api_metrics import pageJson
+from api_registry import ConnectorRegistry, loadCredentials
+from api_stream import rechunkRecords
+from api_transport import getTransport
+from concurrent.futures import ThreadPoolExecutor
+
+class Lattice(metaclass=ConnectorRegistry):
     # ¡--- Initiate an instance to Lattice with the given credentials (set headers) ---!
     # - https://developers.lattice.com/reference/authentication
     # - Requires: the path of the json file with the necessary login credentials
-    def __init__(self, credentials_path):
-        with open(credentials_path, 'r') as credentials_file:
-            credentials_items = json.load(credentials_file)
+    # - Optional: a response cache (api_cache.ResponseCache), it can be shared with the other connectors
+    def __init__(self, credentials_path, response_cache=None):
+        credentials_items = loadCredentials(credentials_path)
         logging.critical('API [lattice][aux]: Credentials read successfully')
 
         self.url_base = credentials_items['base_url']
@@ -25,42 +30,88 @@ class Lattice:
             'Authorization' : f'Bearer {credentials_items["api_key"]}',
             'Accept'        : 'application/json'
         }
+        self.transport = getTransport()
+        self.response_cache = response_cache
         logging.critical('API [lattice][aux]: Headers set successfully')
 
     # ¡--- Get the full list of users ---!
     # - https://developers.lattice.com/reference/api_users
-    # - Requires: n/a
-    def getListAllUsers(self):
-        url_endpoint = '/users?limit=100'
+    # - Optional: the result format (pandas, records, arrow)
+    def getListAllUsers(self, request_format='pandas'):
+        logging.info('API [lattice][get | users]: Sending initial request')
+        return self._getCursorFrame('users', '/users?limit=100', request_format)
+
+    # ¡--- Iterate over the full list of users, one data-frame chunk at a time ---!
+    # - https://developers.lattice.com/reference/api_users
+    # - Optional: the amount of rows per chunk, when not given every page is its own chunk
+    # - Optional: a list with the required fields (e.g. ['id', 'email', 'manager.id']), they fix the columns of every
+    #   chunk, otherwise the fields are discovered as the pages arrive and a later chunk may bring new columns
+    #   (pass the same fields as output_columns to api_stream.writeChunks, with '.' as separator)
+    # - Only the current chunk is held in memory, see api_stream.writeChunks to persist them
+    # - Raises a RuntimeError when a request fails mid-stream, so a partial result is never taken as complete
+    def iterUsers(self, request_chunk=None, request_fields=None):
+        logging.info('API [lattice][iter | users]: Sending initial request')
+        users_pages = self._iterCursorPages('users', '/users?limit=100', cursor_strict=True)
+        users_flattener = Flattener(request_fields=request_fields, metric_name='lattice/users')
+
+        for chunk_records in rechunkRecords(users_pages, request_chunk):
+            users_flattener.extend(chunk_records)
+            yield users_flattener.drain()
+
+    # ¡--- Get every page of a cursor paginated endpoint as a single data-frame ---!
+    # - Requires: the endpoint name (e.g. users, reviews, goals, feedback) and its url with the page limit
+    # - Optional: the result format (pandas, records, arrow)
+    # - Cursor pages can't be requested ahead of time, but each page is normalized on a worker thread while
+    #   the request for the next one is already in flight
+    def _getCursorFrame(self, url_name, url_endpoint, request_format='pandas'):
+        checkFormat(request_format)
+        cursor_flattener = Flattener(metric_name=f'lattice/{url_name}')
+        cursor_pending = None
+
+        with ThreadPoolExecutor(max_workers=1) as cursor_pool:
+            for cursor_data in self._iterCursorPages(url_name, url_endpoint):
+                if cursor_pending is not None:
+                    cursor_pending.result()
+                if cursor_data is None:
+                    return emptyResult(request_format)
+                cursor_pending = cursor_pool.submit(cursor_flattener.extend, cursor_data)
+
+            if cursor_pending is not None:
+                cursor_pending.result()
+
+        return cursor_flattener.toOutput(request_format)
+
+    # ¡--- Yield the raw records of every page of a cursor paginated endpoint ---!
+    # - Requires: the endpoint name (e.g. users, reviews, goals, feedback) and its url with the page limit
+    # - Every response is parsed once, the next cursor is read before the page is handed over
+    # - Yields None (and stops) when a request could not be completed, or raises a RuntimeError when strict
+    def _iterCursorPages(self, url_name, url_endpoint, cursor_strict=False):
         url_page = ''
 
-        logging.info('API [lattice][get | users]: Sending initial request')
         while True:
-            users_result = rq.get(
-                url     = self.url_base + url_endpoint + url_page,
+            cursor_result = cachedGet(
+                self.response_cache, self.transport, self.url_base + url_endpoint + url_page, f'lattice/{url_name}',
                 headers = self.headers,
             )
 
-            if users_result.status_code == 200:
-                if url_page == '':
-                    logging.info('API: [lattice][get | users]: Initial request successful, checking for pagination results')
-                    list_all_users_result = pd.json_normalize(users_result.json()['data'])
+            if cursor_result.status_code != 200:
+                logging.error(f'API [lattice][get | {url_name}]: Could not complete request ({url_page or "initial page"})')
+                if cursor_strict:
+                    raise RuntimeError(f'Lattice {url_name} request failed with status {cursor_result.status_code} ({url_page or "initial page"})')
+                yield None
+                break
 
-                else:
-                    logging.info(f'API [lattice][get | users]: Results for page complete')
-                    list_all_users_page = pd.json_normalize(users_result.json()['data'])
-                    list_all_users_result = pd.concat([list_all_users_result, list_all_users_page])
+            cursor_json = pageJson(cursor_result, f'lattice/{url_name}')
+            if url_page == '':
+                logging.info(f'API [lattice][get | {url_name}]: Initial request successful, checking for pagination results')
+            else:
+                logging.info(f'API [lattice][get | {url_name}]: Results for page complete')
 
-                if users_result.json()['hasMore'] == True:
-                    logging.info('API [lattice][get | users]: More results detected, sending additional request')
-                    url_page = f'&startingAfter={users_result.json()["endingCursor"]}'
-                else:
-                    logging.info('API [lattice][get | users]: No more results detected')
-                    break
+            if cursor_json['hasMore'] == True:
+                logging.info(f'API [lattice][get | {url_name}]: More results detected, sending additional request')
+                url_page = f'&startingAfter={cursor_json["endingCursor"]}'
+                yield cursor_json['data']
             else:
-                logging.error('API [lattice][get | users]; Could not complete request')
-                print(url_page)
-                list_all_users_result = pd.DataFrame()
+                logging.info(f'API [lattice][get | {url_name}]: No more results detected')
+                yield cursor_json['data']
                 break
-                
-        return list_all_users_result.reset_index(drop=True)
\ No newline at end of file
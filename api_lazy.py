@@ -0,0 +1,34 @@
+# ====================================================================================================
+# Lazy imports of the heavy dependencies (pandas, pyarrow, boto3, simple-salesforce) to keep the start-up time low
+#
+# Documentation:
+#     - importlib (import_module) : https://docs.python.org/3/library/importlib.html#importlib.import_module
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import importlib
+import threading
+
+class LazyModule:
+    # ¡--- Stand-in for a module that is only imported the first time one of its attributes is used ---!
+    # - Requires: the full name of the module (e.g. pandas, pyarrow.compute)
+    # - A missing module raises its ModuleNotFoundError on first use instead of when the connector is imported
+    def __init__(self, module_name):
+        self._module_name = module_name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute_name):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._module_name)
+
+        return getattr(self._module, attribute_name)
+
+    def __repr__(self):
+        return f'<lazy module {self._module_name!r} ({"loaded" if self._module is not None else "not loaded"})>'
+
+# ¡--- Get a lazy stand-in of a module (e.g. pd = lazyImport('pandas')) ---!
+def lazyImport(module_name):
+    return LazyModule(module_name)
@@ -0,0 +1,152 @@
+# ====================================================================================================
+# Instrumentation hooks shared by the connectors (requests, pages, normalization) and their metric sinks
+#
+# Documentation:
+#     - prometheus (text format) : https://prometheus.io/docs/instrumenting/exposition_formats/
+#
+# Events emitted:
+#     - request    : host, method, status               | seconds, bytes, retries   (api_transport)
+#     - page       : name                               | seconds, bytes            (pageJson, one per page decoded)
+#     - normalize  : name                               | seconds, rows             (api_flatten, one per page)
+#     - frame      : name                               | seconds, rows             (api_flatten, one per data-frame)
+#     - redshift   : status                             | seconds, rows             (api_aws-WIP)
+#     - salesforce : operation, status                  | seconds, rows             (api_salesforce)
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import logging
+import os
+import threading
+import time
+
+_sinks = []
+
+# ¡--- Install a sink, every event emitted from now on is handed to it ---!
+def addSink(metrics_sink):
+    _sinks.append(metrics_sink)
+    return metrics_sink
+
+# ¡--- Remove a sink that was installed with addSink ---!
+def removeSink(metrics_sink):
+    if metrics_sink in _sinks:
+        _sinks.remove(metrics_sink)
+
+# ¡--- Whether any sink is installed (lets callers skip the timing work altogether) ---!
+def metricsEnabled():
+    return bool(_sinks)
+
+# ¡--- Emit an event to every sink, it costs a single check when no sink is installed ---!
+# - Requires: the event name and its labels (dictionary of strings), the values are passed as keywords
+def emit(event_name, event_labels, **event_values):
+    if not _sinks:
+        return
+
+    for metrics_sink in list(_sinks):
+        try:
+            metrics_sink.record(event_name, event_labels, event_values)
+        except Exception as sink_error:
+            logging.error(f'API [metrics][{event_name}]: Sink failed ({sink_error.__class__.__name__})')
+
+# ¡--- Decode the json body of a fetched page, reporting its parse time to the sinks (page event) ---!
+# - Requires: the response and the name of the endpoint (e.g. harvest/time_entries)
+# - Responses served by api_cache were decoded (and reported) when they were stored, they are returned as-is
+def pageJson(response, page_name):
+    if not _sinks or getattr(response, 'from_cache', False):
+        return response.json()
+
+    page_start = time.perf_counter()
+    page_json = response.json()
+    emit('page', {'name': page_name}, seconds=time.perf_counter() - page_start, bytes=len(getattr(response, 'content', None) or b'') or None)
+
+    return page_json
+
+class CallbackSink:
+    # ¡--- Hand every event to a callback(event_name, event_labels, event_values) ---!
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, event_name, event_labels, event_values):
+        self.callback(event_name, event_labels, event_values)
+
+class MemorySink:
+    # ¡--- Aggregate the events in memory: count plus the sum, min and max of every value per event and labels ---!
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, event_name, event_labels, event_values):
+        series_key = (event_name, tuple(sorted(event_labels.items())))
+
+        with self._lock:
+            series_ent = self._series.setdefault(series_key, {'count': 0, 'values': {}})
+            series_ent['count'] += 1
+            for value_name, value_ent in event_values.items():
+                if value_ent is None:
+                    continue
+                value_stats = series_ent['values'].setdefault(value_name, {'sum': 0, 'min': value_ent, 'max': value_ent})
+                value_stats['sum'] += value_ent
+                value_stats['min'] = min(value_stats['min'], value_ent)
+                value_stats['max'] = max(value_stats['max'], value_ent)
+
+    # ¡--- List of the aggregated series, optionally only the ones of an event ---!
+    # - Returns dictionaries with the event, labels, count and the sum/min/max of each value
+    def summary(self, event_name=None):
+        with self._lock:
+            return [
+                {
+                    'event'     : series_key[0],
+                    'labels'    : dict(series_key[1]),
+                    'count'     : series_ent['count'],
+                    'values'    : {value_name: dict(value_stats) for value_name, value_stats in series_ent['values'].items()}
+                }
+                for series_key, series_ent in self._series.items()
+                if event_name is None or series_key[0] == event_name
+            ]
+
+    # ¡--- Sum of a value across every series of an event ---!
+    def total(self, event_name, value_name):
+        return sum(series_ent['values'].get(value_name, {}).get('sum', 0) for series_ent in self.summary(event_name))
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+class PrometheusSink(MemorySink):
+    # ¡--- In-memory aggregation exported in the prometheus text format ---!
+    # - Every event becomes api_<event>_total plus api_<event>_<value>_sum / _max series
+    def __init__(self, metrics_prefix='api'):
+        super().__init__()
+        self.metrics_prefix = metrics_prefix
+
+    # ¡--- Text of every series, ready to be served on /metrics or written for the textfile collector ---!
+    # - The series are grouped by metric, as the text format requires
+    def export(self):
+        metrics_families = {}
+
+        for series_ent in self.summary():
+            series_labels = ','.join(f'{label_name}="{self._escape(label_value)}"' for label_name, label_value in sorted(series_ent['labels'].items()))
+            series_labels = '{' + series_labels + '}' if series_labels else ''
+            series_metrics = [(f'{series_ent["event"]}_total', 'counter', series_ent['count'])]
+            for value_name, value_stats in series_ent['values'].items():
+                series_metrics.append((f'{series_ent["event"]}_{value_name}_sum', 'counter', value_stats['sum']))
+                series_metrics.append((f'{series_ent["event"]}_{value_name}_max', 'gauge', value_stats['max']))
+
+            for metric_name, metric_type, metric_value in series_metrics:
+                metric_family = metrics_families.setdefault(f'{self.metrics_prefix}_{metric_name}', (metric_type, []))
+                metric_family[1].append(f'{self.metrics_prefix}_{metric_name}{series_labels} {metric_value}')
+
+        metrics_lines = []
+        for metric_name, (metric_type, metric_samples) in sorted(metrics_families.items()):
+            metrics_lines.append(f'# TYPE {metric_name} {metric_type}')
+            metrics_lines.extend(metric_samples)
+
+        return '\n'.join(metrics_lines) + '\n'
+
+    # ¡--- Write the export into a file (atomically, for the node_exporter textfile collector) ---!
+    def writeTextfile(self, output_path):
+        with open(output_path + '.tmp', 'w') as output_file:
+            output_file.write(self.export())
+        os.replace(output_path + '.tmp', output_path)
+
+    def _escape(self, label_value):
+        return str(label_value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
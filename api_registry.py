@@ -0,0 +1,65 @@
+# ====================================================================================================
+# Process-wide registry of the connectors and a cache of their credential files
+#
+# Documentation:
+#     - metaclasses (__call__)  : https://docs.python.org/3/reference/datamodel.html#metaclasses
+#     - functools (lru_cache)   : https://docs.python.org/3/library/functools.html#functools.lru_cache
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+class ConnectorRegistry(type):
+    # ¡--- Metaclass of the connectors, building one again with the same credentials returns the existing instance ---!
+    # - The instances are keyed by class, the real path of the credentials file and the other arguments (defaults
+    #   included, so Lattice(path) and Lattice(path, response_cache=None) match), editing the file builds a fresh instance
+    # - Arguments that can't be hashed skip the registry, a failed construction is tried again on the next call
+    def __call__(cls, credentials_path, *args, **kwargs):
+        try:
+            registry_arguments = inspect.signature(cls.__init__).bind(None, credentials_path, *args, **kwargs)
+            registry_arguments.apply_defaults()
+            registry_key = (cls, os.path.realpath(credentials_path), tuple(registry_arguments.arguments.items())[2:])
+            registry_mtime = os.stat(credentials_path).st_mtime_ns
+            hash(registry_key)
+        except (OSError, TypeError):
+            return super().__call__(credentials_path, *args, **kwargs)
+
+        with _registry_lock:
+            registry_entry = _registry.get(registry_key)
+            if registry_entry is None or registry_entry['mtime'] != registry_mtime:
+                registry_entry = {'mtime': registry_mtime, 'lock': threading.Lock(), 'instance': None}
+                _registry[registry_key] = registry_entry
+
+        # the lock of the entry keeps a single login per key without holding back the other connectors
+        with registry_entry['lock']:
+            if registry_entry['instance'] is None:
+                registry_entry['instance'] = super().__call__(credentials_path, *args, **kwargs)
+            else:
+                logging.info(f'API [registry][{cls.__name__}]: Reusing the instance built for [{credentials_path}]')
+
+        return registry_entry['instance']
+
+# ¡--- Forget every registered instance (e.g. after rotating credentials in place) ---!
+def clearRegistry():
+    with _registry_lock:
+        _registry.clear()
+
+# ¡--- Read a json credentials file once per modification, later reads are served from memory ---!
+# - Requires: the path of the json file with the credentials
+# - Returns a copy, so callers can't change the cached entry
+def loadCredentials(credentials_path):
+    credentials_path = os.path.realpath(credentials_path)
+    return dict(_readCredentials(credentials_path, os.stat(credentials_path).st_mtime_ns))
+
+@functools.lru_cache(maxsize=32)
+def _readCredentials(credentials_path, credentials_mtime):
+    with open(credentials_path, 'r') as credentials_file:
+        return json.load(credentials_file)
@@ -5,63 +5,273 @@
 #     - simple-salesforce       : https://simple-salesforce.readthedocs.io/en/latest/
 #     - salesforce (soql/sosl)  : https://developer.salesforce.com/docs/atlas.en-us.238.0.soql_sosl.meta/soql_sosl/sforce_api_calls_soql_sosl_intro.htm
 #     - salesforce (objects)    : https://developer.salesforce.com/docs/atlas.en-us.238.0.object_reference.meta/object_reference/sforce_api_objects_concepts.htm
+#     - salesforce (sessions)   : https://help.salesforce.com/s/articleView?id=sf.admin_sessions.htm
 #
 # Developed by @Zapata: rl-zapata.github.io
 # ====================================================================================================
-import json
 import logging
-import pandas as pd
+import threading
+import time
 
-from simple_salesforce import Salesforce
+from api_cache import DiskCache
+from api_flatten import checkFormat
+from api_lazy import lazyImport
+from api_metrics import emit
+from api_registry import ConnectorRegistry, loadCredentials
+from api_stream import rechunkRecords, writeChunks
+from api_transport import getTransport
+from collections import defaultdict
 
-class SimpleSF:
+pa = lazyImport('pyarrow')
+pd = lazyImport('pandas')
+simple_salesforce = lazyImport('simple_salesforce')
+
+class SimpleSF(metaclass=ConnectorRegistry):
     # ¡--- Sign-in to salesforce with the given credentials ---!
     # - https://simple-salesforce.readthedocs.io/en/latest/user_guide/examples.html
     # - Requires: the path of the json file that contains the necessary login credentials
-    def __init__(self, credentials_path):
-        with open(credentials_path, 'r') as credentials_file:
-            credentials_items = json.load(credentials_file)
+    # - Optional: a directory to keep the session in (private to the current user), every process with the same
+    #   credentials reuses it instead of logging in again, and the seconds a stored session is trusted for
+    # - Optional: the REST base url used by the Bulk API 2.0 requests, the one of the session by default
+    #   (e.g. http://127.0.0.1:8000/salesforce/ to target the local stand-in of benchmarks/stub_server.py)
+    # - Sessions that expire (INVALID_SESSION_ID) log in again transparently
+    def __init__(self, credentials_path, session_dir=None, session_ttl=7200, base_url=None):
+        self.credentials_path = credentials_path
+        self.base_url = base_url
+        credentials_items = loadCredentials(credentials_path)
         logging.critical('API [simple-salesforce][aux]: Credentials read successfully')
-        
-        self.credentials = Salesforce(
-            username        = credentials_items['user_name'],
-            password        = credentials_items['user_password'],
-            security_token  = credentials_items['security_token']
-        )
-        logging.critical('API [simple-salesforce][Salesforce]: Login successful')
+
+        self.session_cache = DiskCache(session_dir, private=True) if session_dir is not None else None
+        self.session_key = f'salesforce/{credentials_items["user_name"]}'
+        self.session_ttl = session_ttl
+        self._session_lock = threading.Lock()
+
+        self.credentials = self._sfConnect()
+        self.transport = getTransport()
 
     # ¡--- Execute a SOQL query ---!
     # - https://simple-salesforce.readthedocs.io/en/latest/user_guide/queries.html
     # - Requires: an SOQL statement to be executed, make sure that it is properly formatted and not a malformed SOQL query
-    def sfQuery(self, soql):
+    # - Optional: the result format (pandas, records, arrow), records are returned as salesforce sends them
+    def sfQuery(self, soql, request_format='pandas'):
+        checkFormat(request_format)
         logging.info('API [simple-salesforece][query_all]: Sending query request')
+        query_start = time.monotonic()
+        query_status = 'ok'
 
         try:
-            query_result = self.credentials.query_all(soql)
-            query_result = pd.DataFrame(query_result['records'])
+            query_result = self._sfRetry(lambda: self.credentials.query_all(soql))['records']
+            if request_format == 'pandas':
+                query_result = pd.DataFrame(query_result)
+            elif request_format == 'arrow':
+                query_result = pa.Table.from_pylist(query_result)
             logging.info('API [simple-salesforce][query_all]: Query finished successfully')
 
         except Exception as query_error:
             query_result = []
+            query_status = 'error'
             logging.error(f'API [simple-salesforce][query_all]: Type ({query_error.__class__.__name__})')
             logging.error(f'API [simple-salesforce][query_all]: {query_error}')
 
-        return query_result
+        return self._sfEmit('query_all', query_start, query_status, query_result)
+
+    # ¡--- Execute a SOQL query through a Bulk API 2.0 query job (meant for large objects) ---!
+    # - https://developer.salesforce.com/docs/atlas.en-us.api_asynch.meta/api_asynch/queries.htm
+    # - Requires: an SOQL statement to be executed, make sure that it is properly formatted and not a malformed SOQL query
+    # - Optional: the same options as sfIterQueryBulk
+    # - Optional: an output path and format (parquet, csv), the chunks are written there instead of being kept in memory
+    # - Returns the data-frame, or the amount of rows written when an output path is given
+    def sfQueryBulk(self, soql, request_chunk=50000, request_mode='auto', request_threshold=10000, output_path=None, output_format='parquet', request_dtypes=None):
+        logging.info('API [simple-salesforce][bulk2]: Sending query request')
+        query_start = time.monotonic()
+        query_status = 'ok'
+
+        try:
+            query_chunks = self.sfIterQueryBulk(soql, request_chunk, request_mode, request_threshold, request_dtypes)
+            if output_path is not None:
+                query_result = writeChunks(query_chunks, output_path, output_format)
+            else:
+                query_result = pd.concat(list(query_chunks) or [pd.DataFrame()]).reset_index(drop=True)
+            logging.info('API [simple-salesforce][bulk2]: Query finished successfully')
+
+        except Exception as query_error:
+            query_result = []
+            query_status = 'error'
+            logging.error(f'API [simple-salesforce][bulk2]: Type ({query_error.__class__.__name__})')
+            logging.error(f'API [simple-salesforce][bulk2]: {query_error}')
+
+        return self._sfEmit('bulk2', query_start, query_status, query_result)
+
+    # ¡--- Iterate over the results of a SOQL query, one data-frame chunk at a time ---!
+    # - https://developer.salesforce.com/docs/atlas.en-us.api_asynch.meta/api_asynch/queries.htm
+    # - Requires: an SOQL statement to be executed, make sure that it is properly formatted and not a malformed SOQL query
+    # - Optional: the amount of rows per chunk
+    # - Optional: the mode (auto, bulk, rest), auto peeks at the first REST page and only creates a bulk job
+    #   when the query has more rows than the threshold, smaller queries keep that page and follow nextRecordsUrl
+    # - Optional: a dictionary of column dtypes (e.g. {'Amount': 'Float64', 'IsDeleted': 'boolean'}), applied to every chunk
+    # - Bulk results are streamed as csv, only the current chunk is held in memory, the csv columns that aren't in
+    #   request_dtypes are read as strings so every chunk has the same dtypes (per chunk inference could change them)
+    def sfIterQueryBulk(self, soql, request_chunk=50000, request_mode='auto', request_threshold=10000, request_dtypes=None):
+        request_mode_valid = ['auto', 'bulk', 'rest']
+        if request_mode not in request_mode_valid:
+            raise ValueError(f'request_mode must be one of: {request_mode_valid}')
+
+        query_head = None
+        if request_mode == 'auto':
+            query_head = self._sfRetry(lambda: self.credentials.query(soql))
+            if query_head['done'] == True:
+                logging.info('API [simple-salesforce][query]: Query fits a single page, skipping the bulk job')
+            request_mode = 'rest' if query_head['done'] == True or query_head['totalSize'] <= request_threshold else 'bulk'
+
+        if request_mode == 'rest':
+            if query_head is None:
+                logging.info('API [simple-salesforce][query]: Sending query request')
+                query_head = self._sfRetry(lambda: self.credentials.query(soql))
+            yield from self._sfRecordsChunks(self._sfIterQueryPages(query_head), request_chunk, request_dtypes)
+            return
+
+        bulk_url = f'{self.base_url or self.credentials.base_url}jobs/query'
+        bulk_session = self.credentials.session_id
+        # never retried on server errors or timeouts, the job may have been created already (a 401 was never processed)
+        bulk_job = self.transport.request('POST', bulk_url, retry=False, headers=self._sfBulkHeaders(), json={'operation': 'query', 'query': soql})
+        if bulk_job.status_code == 401:
+            self._sfRefresh(bulk_session)
+            bulk_job = self.transport.request('POST', bulk_url, retry=False, headers=self._sfBulkHeaders(), json={'operation': 'query', 'query': soql})
+        bulk_job.raise_for_status()
+        bulk_headers = self._sfBulkHeaders()
+        bulk_job = bulk_job.json()['id']
+        logging.info(f'API [simple-salesforce][bulk2]: Query job created ({bulk_job})')
+
+        # wait for the job with growing intervals, capped at 10 seconds
+        bulk_wait = 0.5
+        while True:
+            bulk_state = self.transport.get(f'{bulk_url}/{bulk_job}', headers=bulk_headers)
+            bulk_state.raise_for_status()
+            bulk_state = bulk_state.json()
+
+            if bulk_state['state'] == 'JobComplete':
+                break
+            elif bulk_state['state'] in ('Failed', 'Aborted'):
+                raise RuntimeError(f'Bulk query job {bulk_job} {bulk_state["state"]}: {bulk_state.get("errorMessage")}')
+
+            logging.info(f'API [simple-salesforce][bulk2]: Waiting for query job to finish ({bulk_state["state"]})')
+            time.sleep(bulk_wait)
+            bulk_wait = min(bulk_wait * 2, 10)
+
+        # every result set is streamed and parsed as csv chunks, the locator points to the next one
+        bulk_locator = None
+        while bulk_locator != 'null':
+            bulk_params = {'maxRecords': request_chunk}
+            if bulk_locator is not None:
+                bulk_params['locator'] = bulk_locator
+
+            bulk_result = self.transport.get(f'{bulk_url}/{bulk_job}/results', headers=self._sfBulkHeaders('text/csv'), params=bulk_params, stream=True)
+            bulk_result.raise_for_status()
+            bulk_locator = bulk_result.headers.get('Sforce-Locator', 'null')
+            logging.info(f'API [simple-salesforce][bulk2]: Reading result set ({bulk_result.headers.get("Sforce-NumberOfRecords")} records)')
+
+            bulk_result.raw.decode_content = True
+            with bulk_result:
+                yield from pd.read_csv(bulk_result.raw, chunksize=request_chunk, dtype=defaultdict(lambda: 'string', request_dtypes or {}))
+
+    # ¡--- Get a session: the stored one while it is trusted, a new login otherwise ---!
+    # - Optional: the id of a session known to be expired, it is never reused even if it is still stored
+    def _sfConnect(self, sf_expired=None):
+        session_entry = self.session_cache.get(self.session_key) if self.session_cache is not None else None
+
+        if session_entry is not None and session_entry['session_id'] != sf_expired and time.time() - session_entry['stored'] < self.session_ttl:
+            logging.critical('API [simple-salesforce][Salesforce]: Reusing stored session')
+            return simple_salesforce.Salesforce(session_id=session_entry['session_id'], instance_url=session_entry['instance_url'])
+
+        credentials_items = loadCredentials(self.credentials_path)
+        sf_credentials = simple_salesforce.Salesforce(
+            username        = credentials_items['user_name'],
+            password        = credentials_items['user_password'],
+            security_token  = credentials_items['security_token']
+        )
+        logging.critical('API [simple-salesforce][Salesforce]: Login successful')
+
+        if self.session_cache is not None:
+            self.session_cache.set(self.session_key, {
+                'session_id'    : sf_credentials.session_id,
+                'instance_url'  : f'https://{sf_credentials.sf_instance}',
+                'stored'        : time.time()
+            })
+
+        return sf_credentials
+
+    # ¡--- Replace an expired session, once, even when many threads find out at the same time ---!
+    # - Requires: the id of the session that expired
+    def _sfRefresh(self, sf_expired):
+        with self._session_lock:
+            if self.credentials.session_id == sf_expired:
+                logging.warning('API [simple-salesforce][Salesforce]: Session expired, signing in again')
+                self.credentials = self._sfConnect(sf_expired)
+
+    # ¡--- Run a call, signing in again and repeating it once when the session expired ---!
+    # - simple-salesforce raises SalesforceExpiredSession for the 401 (INVALID_SESSION_ID) responses
+    def _sfRetry(self, sf_call):
+        sf_session = self.credentials.session_id
+        try:
+            return sf_call()
+        except simple_salesforce.SalesforceExpiredSession:
+            self._sfRefresh(sf_session)
+            return sf_call()
+
+    # ¡--- Yield the records of a REST query page by page, starting from a page that was already received ---!
+    # - Requires: a query response (e.g. of credentials.query), the next pages are requested through nextRecordsUrl
+    def _sfIterQueryPages(self, query_page):
+        yield from query_page['records']
+
+        while query_page['done'] != True:
+            logging.info('API [simple-salesforce][query_more]: Getting the next page of results')
+            query_page = self._sfRetry(lambda: self.credentials.query_more(query_page['nextRecordsUrl'], identifier_is_url=True))
+            yield from query_page['records']
+
+    # ¡--- Headers of the Bulk API 2.0 requests (current session) ---!
+    # - Optional: the accepted content type, the job requests answer json and only the results are csv
+    def _sfBulkHeaders(self, bulk_accept='application/json'):
+        return {
+            'Authorization' : f'Bearer {self.credentials.session_id}',
+            'Content-Type'  : 'application/json',
+            'Accept'        : bulk_accept
+        }
+
+    # ¡--- Report an operation to the instrumentation hooks (api_metrics) and hand its result back ---!
+    # - Failed operations return an empty list, bulk extractions written to a file return their amount of rows
+    def _sfEmit(self, sf_operation, sf_start, sf_status, sf_result):
+        emit(
+            'salesforce', {'operation': sf_operation, 'status': sf_status},
+            seconds = time.monotonic() - sf_start,
+            rows    = sf_result if isinstance(sf_result, int) else len(sf_result)
+        )
+
+        return sf_result
+
+    # ¡--- Turn REST query records into data-frame chunks (without the attributes column) ---!
+    # - Optional: a dictionary of column dtypes applied to every chunk
+    def _sfRecordsChunks(self, query_records, request_chunk, request_dtypes=None):
+        for chunk_records in rechunkRecords(([query_record] for query_record in query_records), request_chunk):
+            chunk_ent = pd.DataFrame(chunk_records).drop(columns='attributes', errors='ignore')
+            yield chunk_ent.astype({column_name: column_type for column_name, column_type in (request_dtypes or {}).items() if column_name in chunk_ent.columns})
 
     # ¡--- Execute a SOQL query ---!
     # - https://simple-salesforce.readthedocs.io/en/latest/user_guide/queries.html
     # - Requires: an SOSL statement to be executed, make sure that it is properly formatted and not a malformed SOSL query
     def sfSearch(self, sosl):
         logging.info('API [simple-salesforece][search]: Sending search request')
+        search_start = time.monotonic()
+        search_status = 'ok'
 
         try:
-            search_result = self.credentials.search(sosl)
+            search_result = self._sfRetry(lambda: self.credentials.search(sosl))
             search_result = pd.DataFrame(search_result['searchRecords'])
             logging.info('API [simple-salesforce][search]: Search finished successfully')
 
         except Exception as search_error:
             search_result = []
+            search_status = 'error'
             logging.error(f'API [simple-salesforce][search]: Type ({search_error.__class__.__name__})')
             logging.error(f'API [simple-salesforce][search]: {search_error}')
 
-        return search_result
+        return self._sfEmit('search', search_start, search_status, search_result)
@@ -0,0 +1,118 @@
+# ====================================================================================================
+# Local state store (sqlite) used by the connectors to keep incremental syncs between runs
+#
+# Documentation:
+#     - sqlite3 : https://docs.python.org/3/library/sqlite3.html
+#     - upsert  : https://www.sqlite.org/lang_upsert.html
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import contextlib
+import json
+import logging
+import sqlite3
+
+class SyncStore:
+    # ¡--- Open (or create) the local state store ---!
+    # - Requires: the path of the sqlite file that keeps the synced records and their high-water marks
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.connection = sqlite3.connect(store_path)
+        self._transaction = False
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                resource    TEXT PRIMARY KEY,
+                watermark   TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sync_records (
+                resource    TEXT,
+                record_id   TEXT,
+                updated_at  TEXT,
+                record      TEXT,
+                PRIMARY KEY (resource, record_id)
+            );
+        ''')
+        logging.info(f'API [state][aux]: Store opened successfully ({store_path})')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # ¡--- Group every write of a run in a single transaction, committed at the end and rolled back on error ---!
+    # - The writes made inside (upsertRecords, setWatermark) join it instead of committing on their own, so a
+    #   failed run leaves the store exactly as it was and the next run reports its records again
+    @contextlib.contextmanager
+    def transaction(self):
+        if self._transaction:
+            yield
+            return
+
+        self._transaction = True
+        try:
+            with self.connection:
+                yield
+        finally:
+            self._transaction = False
+
+    # ¡--- Get the high-water mark of a resource (None when it was never synced) ---!
+    def getWatermark(self, resource):
+        watermark_row = self.connection.execute(
+            'SELECT watermark FROM sync_state WHERE resource = ?', (resource,)
+        ).fetchone()
+
+        return watermark_row[0] if watermark_row else None
+
+    # ¡--- Move the high-water mark of a resource forward (it never goes back) ---!
+    # - Requires: the resource name and the latest last update seen, only call it once every page was received,
+    #   pages aren't ordered by last update so an earlier mark would skip the entries of the pages still missing
+    def setWatermark(self, resource, watermark):
+        watermark_current = self.getWatermark(resource)
+        if watermark is None or (watermark_current is not None and watermark_current >= watermark):
+            return
+
+        with self.transaction():
+            self.connection.execute(
+                '''INSERT INTO sync_state (resource, watermark) VALUES (?, ?)
+                   ON CONFLICT (resource) DO UPDATE SET watermark = excluded.watermark''',
+                (resource, watermark)
+            )
+
+    # ¡--- Upsert a batch of records into the local copy (the high-water mark is left as-is, see setWatermark) ---!
+    # - Requires: the resource name and a list of raw records (dictionaries)
+    # - Optional: the name of the id and last update fields of the records
+    # - Returns only the records that are new or changed compared to the local copy
+    def upsertRecords(self, resource, records, id_field='id', updated_field='updated_at'):
+        records_changed = []
+
+        with self.transaction():
+            for record_ent in records:
+                record_id = str(record_ent[id_field])
+                record_updated = record_ent.get(updated_field)
+
+                record_row = self.connection.execute(
+                    'SELECT updated_at FROM sync_records WHERE resource = ? AND record_id = ?', (resource, record_id)
+                ).fetchone()
+                if record_row is not None and record_row[0] == record_updated:
+                    continue
+
+                self.connection.execute(
+                    '''INSERT INTO sync_records (resource, record_id, updated_at, record) VALUES (?, ?, ?, ?)
+                       ON CONFLICT (resource, record_id) DO UPDATE SET updated_at = excluded.updated_at, record = excluded.record''',
+                    (resource, record_id, record_updated, json.dumps(record_ent))
+                )
+                records_changed.append(record_ent)
+
+        return records_changed
+
+    # ¡--- Get every record of a resource from the local copy ---!
+    def getRecords(self, resource):
+        record_rows = self.connection.execute(
+            'SELECT record FROM sync_records WHERE resource = ? ORDER BY rowid', (resource,)
+        )
+
+        return [json.loads(record_row[0]) for record_row in record_rows]
@@ -0,0 +1,98 @@
+# ====================================================================================================
+# Set of helpers to work with the paginated results of the connectors as a stream of chunks
+#
+# Documentation:
+#     - pyarrow (parquet writer) : https://arrow.apache.org/docs/python/generated/pyarrow.parquet.ParquetWriter.html
+#     - pandas (to_csv)          : https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.to_csv.html
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import logging
+
+# ¡--- Re-batch a stream of record pages into lists of a fixed amount of rows ---!
+# - Requires: an iterable of record lists (one per page)
+# - Optional: the amount of rows per chunk, when not given every page is its own chunk
+def rechunkRecords(record_pages, chunk_rows=None):
+    if not chunk_rows:
+        for page_records in record_pages:
+            if page_records:
+                yield page_records
+        return
+
+    chunk_records = []
+    for page_records in record_pages:
+        chunk_records.extend(page_records)
+        while len(chunk_records) >= chunk_rows:
+            yield chunk_records[:chunk_rows]
+            chunk_records = chunk_records[chunk_rows:]
+
+    if chunk_records:
+        yield chunk_records
+
+# ¡--- Write a stream of data-frame chunks into a single parquet or csv file ---!
+# - Requires: an iterable of data-frames (e.g. Harvest.iterTimeEntries) and the output path
+# - Optional: the output format (parquet, csv)
+# - Optional: the columns of the file (every chunk is projected on them, missing ones are left null) or, for parquet,
+#   the full pyarrow schema, when neither is given the columns of the first chunk are used and a later chunk that
+#   brings a column they don't have raises a ValueError instead of being truncated
+# - Parquet columns that are still all-null in the first chunk get a type that later chunks can be cast to (see _nullField)
+#   unless a schema is given
+def writeChunks(chunks, output_path, output_format='parquet', output_columns=None, output_schema=None):
+    output_format_valid = ['parquet', 'csv']
+    if output_format not in output_format_valid:
+        raise ValueError(f'output_format must be one of: {output_format_valid}')
+    elif output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    elif output_schema is not None:
+        raise ValueError('output_schema is only supported with the parquet output_format')
+
+    if output_schema is not None:
+        output_columns = list(output_schema.names)
+    output_fixed = output_columns is not None
+    output_writer = None
+    output_rows = 0
+
+    try:
+        for chunk_cnt, chunk_ent in enumerate(chunks):
+            if output_columns is None:
+                output_columns = list(chunk_ent.columns)
+            elif not output_fixed and not set(chunk_ent.columns) <= set(output_columns):
+                raise ValueError(
+                    f'Chunk [{chunk_cnt + 1}] has columns that are not in the file {sorted(set(chunk_ent.columns) - set(output_columns))}, '
+                    'pass output_columns (or output_schema) to fix the columns up front'
+                )
+            chunk_ent = chunk_ent.reindex(columns=output_columns)
+
+            if output_format == 'parquet':
+                chunk_table = pa.Table.from_pandas(chunk_ent, preserve_index=False)
+                if output_writer is None:
+                    if output_schema is None:
+                        output_schema = pa.schema([
+                            _nullField(pa, output_field) if chunk_table.column(output_field.name).null_count == len(chunk_table) else output_field
+                            for output_field in chunk_table.schema
+                        ])
+                    output_writer = pq.ParquetWriter(output_path, output_schema)
+                output_writer.write_table(chunk_table.cast(output_writer.schema))
+            else:
+                chunk_ent.to_csv(output_path, mode='w' if chunk_cnt == 0 else 'a', header=chunk_cnt == 0, index=False)
+
+            output_rows += len(chunk_ent)
+            logging.info(f'API [stream][write | {output_format}]: Chunk [{chunk_cnt + 1}] written, [{output_rows}] rows so far')
+    finally:
+        if output_writer is not None:
+            output_writer.close()
+
+    return output_rows
+
+# ¡--- Type of a parquet column that is all-null in the first chunk (pandas can't tell what it will hold) ---!
+# - Untyped and categorical columns become (dictionary) strings, datetimes keep their time zone with nanoseconds
+def _nullField(pa, output_field):
+    if pa.types.is_dictionary(output_field.type):
+        return output_field.with_type(pa.dictionary(pa.int32(), pa.string()))
+    elif pa.types.is_timestamp(output_field.type):
+        return output_field.with_type(pa.timestamp('ns', tz=output_field.type.tz))
+    elif pa.types.is_null(output_field.type):
+        return output_field.with_type(pa.string())
+
+    return output_field
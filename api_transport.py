@@ -0,0 +1,199 @@
+# ====================================================================================================
+# Shared HTTP transport used by the REST connectors (pooled sessions, retries and rate-limit pacing)
+#
+# Documentation:
+#     - requests (sessions)     : https://requests.readthedocs.io/en/latest/user/advanced/#session-objects
+#     - urllib3 (pool manager)  : https://urllib3.readthedocs.io/en/stable/advanced-usage.html
+#     - retry-after header      : https://www.rfc-editor.org/rfc/rfc9110#field.retry-after
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import email.utils
+import http.cookiejar
+import logging
+import random
+import threading
+import time
+import requests as rq
+
+from api_metrics import emit, metricsEnabled
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+# Published client side limits as (requests, seconds), the rest are learned from the response headers
+RATE_LIMITS = {
+    'api.harvestapp.com'    : (100, 15),
+}
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Methods that can be sent again without side effects, the rest are only retried on 429 unless the call opts in
+RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+class Transport:
+    # ¡--- Initiate a transport with one keep-alive session per host ---!
+    # - Optional: the connection pool size per host, the amount of retries, the backoff base and cap (in seconds),
+    #   a dictionary of client side rate limits per host and the default request timeout
+    def __init__(self, pool_size=10, retry_total=5, backoff_base=0.5, backoff_max=60, rate_limits=None, timeout=(10, 300)):
+        self.pool_size = pool_size
+        self.retry_total = retry_total
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = dict(RATE_LIMITS if rate_limits is None else rate_limits)
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._hosts = {}
+
+    # ¡--- Send a GET request through the shared pool ---!
+    # - Requires: the url to request, any other keyword is passed as-is to requests (headers, auth, params, ...)
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    # ¡--- Send a request, pacing it against the host limits and retrying throttled or failed calls ---!
+    # - Requires: the http method and url, any other keyword is passed as-is to requests
+    # - Optional: whether to retry the call on server errors, connection errors and timeouts, by default only the
+    #   idempotent methods are (a POST that timed out may have been processed), 429 responses are always retried
+    # - Returns the last response received, callers keep checking the status code as with requests
+    def request(self, method, url, retry=None, **kwargs):
+        host = urlsplit(url).netloc
+        session = self._session(host)
+        kwargs.setdefault('timeout', self.timeout)
+        request_retry = method.upper() in RETRY_METHODS if retry is None else retry
+        request_start = time.perf_counter()
+
+        for retry_cnt in range(self.retry_total + 1):
+            self._pace(host)
+            try:
+                response = session.request(method, url, **kwargs)
+            except (rq.ConnectionError, rq.Timeout) as request_error:
+                if retry_cnt == self.retry_total or not request_retry:
+                    emit('request', {'host': host, 'method': method, 'status': 'error'}, seconds=time.perf_counter() - request_start, retries=retry_cnt)
+                    raise
+                retry_wait = self._backoff(retry_cnt)
+                logging.warning(f'API [transport][{host}]: {request_error.__class__.__name__}, retrying in [{retry_wait:.2f}] seconds')
+                time.sleep(retry_wait)
+                continue
+
+            self._learn(host, response)
+            if response.status_code not in RETRY_STATUS or retry_cnt == self.retry_total:
+                break
+            elif response.status_code != 429 and not request_retry:
+                break
+
+            retry_wait = self._retryAfter(response)
+            if retry_wait is None:
+                retry_wait = self._backoff(retry_cnt)
+            logging.warning(f'API [transport][{host}]: Status {response.status_code}, retrying in [{retry_wait:.2f}] seconds ({retry_cnt + 1} | {self.retry_total})')
+            self._block(host, retry_wait)
+
+        if metricsEnabled():
+            # streamed bodies aren't read here, only their declared length is known
+            response_bytes = response.headers.get('Content-Length')
+            response_bytes = int(response_bytes) if response_bytes is not None else (None if kwargs.get('stream') else len(response.content))
+            emit(
+                'request', {'host': host, 'method': method, 'status': str(response.status_code)},
+                seconds = time.perf_counter() - request_start,
+                bytes   = response_bytes,
+                retries = retry_cnt
+            )
+
+        return response
+
+    # ¡--- Get (or create) the keep-alive session for a host ---!
+    # - The session is shared by every connector of the host (e.g. two Harvest accounts), it never keeps the cookies
+    #   it receives so sharing connections never shares state, cookies passed to a request are still sent
+    def _session(self, host):
+        with self._lock:
+            if host not in self._sessions:
+                session = rq.Session()
+                session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+                self._hosts[host] = {'sent': deque(), 'blocked_until': 0.0}
+
+        return self._sessions[host]
+
+    # ¡--- Wait until the host can take another request (client side window and server side blocks) ---!
+    def _pace(self, host):
+        with self._lock:
+            host_state = self._hosts[host]
+            time_now = time.monotonic()
+            pace_wait = max(0.0, host_state['blocked_until'] - time_now)
+
+            if host in self.rate_limits:
+                limit_calls, limit_window = self.rate_limits[host]
+                host_sent = host_state['sent']
+                while host_sent and host_sent[0] <= time_now + pace_wait - limit_window:
+                    host_sent.popleft()
+                # the slot limit_calls back (not the oldest one) bounds the window, requests queued at the same
+                # time are spread over the following windows instead of piling up in the first free one
+                if len(host_sent) >= limit_calls:
+                    pace_wait = max(pace_wait, host_sent[-limit_calls] + limit_window - time_now)
+                host_sent.append(time_now + pace_wait)
+
+        if pace_wait > 0:
+            logging.info(f'API [transport][{host}]: Pacing request for [{pace_wait:.2f}] seconds')
+            time.sleep(pace_wait)
+
+    # ¡--- Block every request to a host for the given amount of seconds ---!
+    def _block(self, host, block_seconds):
+        with self._lock:
+            host_state = self._hosts[host]
+            host_state['blocked_until'] = max(host_state['blocked_until'], time.monotonic() + block_seconds)
+
+    # ¡--- Read the vendor rate-limit headers and hold the host back before the limit is hit ---!
+    # - X-RateLimit-* (greenhouse, lattice) and the RateLimit-* draft headers
+    def _learn(self, host, response):
+        limit_remaining = response.headers.get('X-RateLimit-Remaining', response.headers.get('RateLimit-Remaining'))
+        if limit_remaining is None:
+            return
+
+        try:
+            limit_remaining = int(limit_remaining)
+        except ValueError:
+            return
+
+        if limit_remaining <= 1:
+            limit_reset = response.headers.get('X-RateLimit-Reset', response.headers.get('RateLimit-Reset'))
+            try:
+                limit_reset = float(limit_reset)
+                # some vendors send an epoch timestamp, others the seconds left in the window
+                limit_reset = limit_reset - time.time() if limit_reset > 1e9 else limit_reset
+            except (TypeError, ValueError):
+                limit_reset = 1.0
+            self._block(host, min(max(limit_reset, 0.0), self.backoff_max))
+
+    # ¡--- Exponential backoff with full jitter ---!
+    def _backoff(self, retry_cnt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry_cnt))
+
+    # ¡--- Parse the Retry-After header (seconds or http date) ---!
+    def _retryAfter(self, response):
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return None
+
+        try:
+            retry_wait = float(retry_after)
+        except ValueError:
+            try:
+                retry_wait = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+
+        return min(max(retry_wait, 0.0), self.backoff_max)
+
+_transport_shared = None
+_transport_lock = threading.Lock()
+
+# ¡--- Get the process-wide transport shared by every connector ---!
+def getTransport():
+    global _transport_shared
+    with _transport_lock:
+        if _transport_shared is None:
+            _transport_shared = Transport()
+
+    return _transport_shared
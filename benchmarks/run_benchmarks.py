@@ -0,0 +1,235 @@
+# ====================================================================================================
+# Offline benchmarks of the connectors' pagination and normalization hot paths
+#
+# Usage:
+#     python benchmarks/run_benchmarks.py --rows 20000 --page-size 100 --latency 0.02 --output baseline.json
+#     python benchmarks/run_benchmarks.py --rows 20000 --page-size 100 --latency 0.02 --baseline baseline.json
+#     python benchmarks/run_benchmarks.py --rows 20000 --request-format records
+#
+# Every scenario makes an untimed warm-up call first (lazy imports, connections), then --repeat timed ones
+# The requests and normalization time are read through the api_metrics hooks (MemorySink), p50/p99 are taken over
+# the seconds of every single request (CallbackSink), or of every statement for the redshift scenarios
+# Every scenario runs in its own process against the local stub server (benchmarks/stub_server.py), so the
+# peak rss reported belongs to that scenario only and the server never competes with the client for the GIL
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import argparse
+import importlib.util
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+SCENARIOS = [
+    'harvest_time_entries',
+    'harvest_iter_time_entries',
+    'lattice_users',
+    'greenhouse_jobs',
+    'bamboo_directory',
+    'redshift',
+    'redshift_batch',
+]
+
+# ¡--- Nearest-rank percentile of a list of values ---!
+def percentile(values, percentile_rank):
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, math.ceil(percentile_rank / 100 * len(values)) - 1))]
+
+# ¡--- Build the connector used by a scenario out of a temporary credentials file ---!
+def buildConnector(scenario_name, base_url, credentials_dir):
+    credentials_path = os.path.join(credentials_dir, f'{scenario_name}.json')
+
+    if scenario_name.startswith('harvest'):
+        from api_harvest import Harvest
+        credentials_items = {'user_token': 'stub', 'user_id': '1', 'user_agent': 'benchmarks'}
+    elif scenario_name.startswith('lattice'):
+        from api_lattice import Lattice
+        credentials_items = {'base_url': f'{base_url}/lattice', 'api_key': 'stub'}
+    elif scenario_name.startswith('greenhouse'):
+        from api_greenhouse import Greenhouse
+        credentials_items = {'base_url': f'{base_url}/greenhouse/v1/', 'api_key': 'stub'}
+    else:
+        from api_bamboohr import Bamboo
+        credentials_items = {'base_url': f'{base_url}/bamboo', 'subdomain': '/stub', 'api_key': 'stub'}
+
+    with open(credentials_path, 'w') as credentials_file:
+        json.dump(credentials_items, credentials_file)
+
+    if scenario_name.startswith('harvest'):
+        connector = Harvest(credentials_path)
+        connector.url_base = f'{base_url}/harvest/v2/'
+    elif scenario_name.startswith('lattice'):
+        connector = Lattice(credentials_path)
+    elif scenario_name.startswith('greenhouse'):
+        connector = Greenhouse(credentials_path)
+    else:
+        connector = Bamboo(credentials_path)
+
+    return connector
+
+# ¡--- Run a single scenario in the current process and return its measurements ---!
+def runScenario(scenario_name, base_url, arguments):
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+    import api_metrics
+
+    if scenario_name.startswith('redshift'):
+        from stub_server import StubRedshiftClient
+        try:
+            aws_spec = importlib.util.spec_from_file_location('api_aws', os.path.join(REPO_DIR, 'api_aws-WIP.py'))
+            api_aws = importlib.util.module_from_spec(aws_spec)
+            aws_spec.loader.exec_module(api_aws)
+        except ImportError as import_error:
+            return {'skipped': f'{import_error.__class__.__name__}: {import_error}'}
+
+        redshift_client = StubRedshiftClient(rows=arguments.rows, page_size=arguments.page_size, latency=arguments.latency * 10)
+        redshift_credentials = {'cluster': 'stub', 'database': 'stub', 'user': 'stub'}
+        if scenario_name == 'redshift':
+            scenario_call = lambda: api_aws.redshift('stub', redshift_credentials, 'select 1', client=redshift_client)
+            scenario_rows = lambda scenario_result: len(scenario_result)
+        else:
+            scenario_call = lambda: api_aws.redshiftBatch('stub', redshift_credentials, ['select 1'] * arguments.statements, client=redshift_client)
+            scenario_rows = lambda scenario_result: sum(len(batch_ent['result']) for batch_ent in scenario_result.values())
+    else:
+        credentials_dir = tempfile.mkdtemp(prefix='benchmarks-')
+        connector = buildConnector(scenario_name, base_url, credentials_dir)
+        scenario_rows = len
+        if scenario_name == 'harvest_time_entries':
+            scenario_call = lambda: connector.getTimeEntries('20240101', '20241231', request_format=arguments.request_format)
+        elif scenario_name == 'harvest_iter_time_entries':
+            scenario_call = lambda: [len(chunk_ent) for chunk_ent in connector.iterTimeEntries('20240101', '20241231')]
+            scenario_rows = sum
+        elif scenario_name == 'lattice_users':
+            scenario_call = lambda: connector.getListAllUsers(request_format=arguments.request_format)
+        elif scenario_name == 'greenhouse_jobs':
+            scenario_call = lambda: connector.getJobsList(request_format=arguments.request_format)
+        else:
+            scenario_call = lambda: connector.getEmployeesDirectory(request_format=arguments.request_format)
+
+    # untimed calls before any sink is installed, the lazy imports (pandas, pyarrow) and the first connections
+    # would otherwise be charged to the first timed call and its normalization
+    for _ in range(arguments.warmup):
+        scenario_call()
+
+    # time spent turning the json records into data-frames, requests and bytes (api_metrics hooks)
+    metrics_sink = api_metrics.addSink(api_metrics.MemorySink())
+
+    # latency of every single request (or redshift statement, which never goes through the transport)
+    latency_times = {'request': [], 'redshift': []}
+    def recordLatency(event_name, event_labels, event_values):
+        if event_name in latency_times and event_values.get('seconds') is not None:
+            latency_times[event_name].append(event_values['seconds'])
+    api_metrics.addSink(api_metrics.CallbackSink(recordLatency))
+
+    call_times = []
+    call_rows = 0
+    for _ in range(arguments.repeat):
+        call_start = time.perf_counter()
+        call_result = scenario_call()
+        call_times.append(time.perf_counter() - call_start)
+        call_rows += scenario_rows(call_result)
+
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss = peak_rss / 1024 ** 2 if sys.platform == 'darwin' else peak_rss / 1024
+
+    latency_list = latency_times['request'] or latency_times['redshift'] or call_times
+    return {
+        'rows'              : call_rows // arguments.repeat,
+        'rows_per_second'   : call_rows / sum(call_times),
+        'call_seconds'      : sum(call_times) / arguments.repeat,
+        'p50_seconds'       : percentile(latency_list, 50),
+        'p99_seconds'       : percentile(latency_list, 99),
+        'peak_rss_mb'       : peak_rss,
+        'normalize_seconds' : (metrics_sink.total('normalize', 'seconds') + metrics_sink.total('frame', 'seconds')) / arguments.repeat,
+        'requests'          : sum(series_ent['count'] for series_ent in metrics_sink.summary('request')) // arguments.repeat,
+        'response_bytes'    : metrics_sink.total('request', 'bytes') // arguments.repeat,
+    }
+
+# ¡--- Print the results (and the change against a baseline) as a table ---!
+def printResults(benchmark_results, baseline_results):
+    print(f'{"scenario":<28}{"rows":>9}{"reqs":>7}{"rows/s":>12}{"call s":>9}{"p50 s":>9}{"p99 s":>9}{"rss mb":>9}{"norm s":>9}{"vs base":>10}')
+    for scenario_name, scenario_result in benchmark_results.items():
+        if 'skipped' in scenario_result:
+            print(f'{scenario_name:<28}skipped ({scenario_result["skipped"]})')
+            continue
+
+        baseline_change = ''
+        baseline_result = baseline_results.get(scenario_name, {})
+        if baseline_result.get('rows_per_second'):
+            baseline_change = f'{scenario_result["rows_per_second"] / baseline_result["rows_per_second"] - 1:+.1%}'
+
+        print(
+            f'{scenario_name:<28}{scenario_result["rows"]:>9}{scenario_result["requests"]:>7}{scenario_result["rows_per_second"]:>12.0f}'
+            f'{scenario_result["call_seconds"]:>9.3f}{scenario_result["p50_seconds"]:>9.3f}{scenario_result["p99_seconds"]:>9.3f}{scenario_result["peak_rss_mb"]:>9.1f}'
+            f'{scenario_result["normalize_seconds"]:>9.3f}{baseline_change:>10}'
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the api connectors')
+    parser.add_argument('--scenarios', nargs='*', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--rows', type=int, default=20000, help='rows served by every endpoint')
+    parser.add_argument('--page-size', type=int, default=100, help='rows per page')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added to every stub request')
+    parser.add_argument('--repeat', type=int, default=3, help='calls per scenario')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed calls per scenario before the timed ones')
+    parser.add_argument('--statements', type=int, default=10, help='statements per redshift batch')
+    parser.add_argument('--request-format', default='pandas', choices=['pandas', 'records', 'arrow'], help='result format of the getters')
+    parser.add_argument('--output', help='write the results as json (e.g. to keep as a baseline)')
+    parser.add_argument('--baseline', help='json results of a previous run to compare against')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    # child process: run a single scenario and print its measurements
+    if arguments.scenario is not None:
+        print(json.dumps(runScenario(arguments.scenario, arguments.base_url, arguments)))
+        return
+
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from stub_server import startStubServer
+    stub_server, base_url = startStubServer(arguments.rows, arguments.page_size, arguments.latency)
+
+    benchmark_results = {}
+    try:
+        for scenario_name in arguments.scenarios:
+            scenario_process = subprocess.run(
+                [
+                    sys.executable, os.path.abspath(__file__),
+                    '--scenario', scenario_name, '--base-url', base_url,
+                    '--rows', str(arguments.rows), '--page-size', str(arguments.page_size),
+                    '--latency', str(arguments.latency), '--repeat', str(arguments.repeat),
+                    '--warmup', str(arguments.warmup),
+                    '--statements', str(arguments.statements), '--request-format', arguments.request_format,
+                ],
+                capture_output=True, text=True
+            )
+            if scenario_process.returncode != 0:
+                benchmark_results[scenario_name] = {'skipped': scenario_process.stderr.strip().splitlines()[-1]}
+            else:
+                benchmark_results[scenario_name] = json.loads(scenario_process.stdout.strip().splitlines()[-1])
+    finally:
+        stub_server.shutdown()
+
+    baseline_results = {}
+    if arguments.baseline is not None:
+        with open(arguments.baseline, 'r') as baseline_file:
+            baseline_results = json.load(baseline_file)['results']
+
+    printResults(benchmark_results, baseline_results)
+
+    if arguments.output is not None:
+        with open(arguments.output, 'w') as output_file:
+            json.dump({'arguments': vars(arguments), 'results': benchmark_results}, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
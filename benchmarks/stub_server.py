@@ -0,0 +1,350 @@
+# ====================================================================================================
+# Local stub server that replays synthetic vendor responses for the benchmarks (no network access needed)
+#
+# Serves:
+#     - /harvest/v2/time_entries          : harvest pages with total_pages and links.last
+#     - /lattice/users                    : lattice pages with hasMore / endingCursor
+#     - /greenhouse/v1/jobs               : greenhouse pages with an RFC 5988 Link header
+#     - /bamboo/stub/v1/employees/directory : bamboohr directory
+#     - /salesforce/jobs/query            : salesforce Bulk API 2.0 query jobs, csv results paged with Sforce-Locator
+# a stand-in of the simple-salesforce client for the REST queries (StubSalesforce)
+# and a stub of the boto3 redshift-data client (StubRedshiftClient)
+#
+# Developed by @Zapata: rl-zapata.github.io
+# ====================================================================================================
+import csv
+import functools
+import io
+import itertools
+import json
+import math
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# ¡--- Synthetic records of each endpoint ---!
+def harvestTimeEntry(entry_id):
+    return {
+        'id'                : entry_id,
+        'spent_date'        : f'2024-{entry_id % 12 + 1:02d}-{entry_id % 28 + 1:02d}',
+        'hours'             : round((entry_id % 16) * 0.25, 2),
+        'rounded_hours'     : round((entry_id % 16) * 0.25, 2),
+        'notes'             : None if entry_id % 3 else f'Worked on item {entry_id}',
+        'is_locked'         : entry_id % 5 == 0,
+        'is_billed'         : False,
+        'billable'          : entry_id % 2 == 0,
+        'billable_rate'     : None if entry_id % 2 else 120.0,
+        'cost_rate'         : 60.0,
+        'created_at'        : '2024-01-01T10:00:00Z',
+        'updated_at'        : f'2024-06-01T10:{entry_id % 60:02d}:00Z',
+        'timer_started_at'  : None,
+        'user'              : {'id': entry_id % 40, 'name': f'User {entry_id % 40}'},
+        'client'            : {'id': entry_id % 25, 'name': f'Client {entry_id % 25}', 'currency': 'USD'},
+        'project'           : {'id': entry_id % 60, 'name': f'Project {entry_id % 60}', 'code': f'P{entry_id % 60}'},
+        'task'              : {'id': entry_id % 15, 'name': f'Task {entry_id % 15}'},
+        'user_assignment'   : {'id': entry_id % 40, 'is_project_manager': False, 'is_active': True, 'hourly_rate': 120.0},
+        'task_assignment'   : {'id': entry_id % 15, 'billable': True, 'is_active': True, 'hourly_rate': 120.0},
+        'invoice'           : None if entry_id % 7 else {'id': entry_id // 7, 'number': str(entry_id // 7)},
+        'external_reference': None,
+    }
+
+def latticeUser(user_id):
+    return {
+        'id'            : str(user_id),
+        'name'          : f'User {user_id}',
+        'email'         : f'user{user_id}@example.com',
+        'title'         : f'Title {user_id % 12}',
+        'status'        : 'ACTIVE',
+        'startDate'     : '2020-01-01',
+        'manager'       : {'id': str(user_id % 50), 'object': 'user', 'url': f'/v1/user/{user_id % 50}'},
+        'department'    : {'id': str(user_id % 8), 'object': 'department', 'url': f'/v1/department/{user_id % 8}'},
+    }
+
+def greenhouseJob(job_id):
+    return {
+        'id'            : job_id,
+        'name'          : f'Job {job_id}',
+        'requisition_id': f'REQ-{job_id}',
+        'status'        : 'open' if job_id % 3 else 'closed',
+        'confidential'  : False,
+        'created_at'    : '2023-01-01T00:00:00.000Z',
+        'updated_at'    : '2024-01-01T00:00:00.000Z',
+        'departments'   : [{'id': job_id % 8, 'name': f'Department {job_id % 8}'}],
+        'offices'       : [{'id': job_id % 4, 'name': f'Office {job_id % 4}'}],
+        'custom_fields' : {'employment_type': 'Full-time', 'salary_range': None},
+    }
+
+def bambooEmployee(employee_id):
+    return {
+        'id'            : str(employee_id),
+        'displayName'   : f'Employee {employee_id}',
+        'firstName'     : 'Employee',
+        'lastName'      : str(employee_id),
+        'jobTitle'      : f'Title {employee_id % 12}',
+        'workEmail'     : f'employee{employee_id}@example.com',
+        'department'    : f'Department {employee_id % 8}',
+        'location'      : f'Office {employee_id % 4}',
+        'supervisor'    : f'Employee {employee_id % 50}',
+    }
+
+def salesforceOpportunity(record_id):
+    return {
+        'Id'            : f'006{record_id:015d}',
+        'Name'          : f'Opportunity {record_id}',
+        'Amount'        : None if record_id % 4 == 0 else round(record_id * 10.5, 2),
+        'IsClosed'      : record_id % 3 == 0,
+        'CloseDate'     : f'2024-{record_id % 12 + 1:02d}-01',
+        'AccountId'     : f'001{record_id % 30:015d}',
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    rows = 10000
+    page_size = 100
+    latency = 0.0
+    greenhouse_last = True
+    failed_pages = ()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.paths.append(self.path)
+        url_parts = urlsplit(self.path)
+        url_query = parse_qs(url_parts.query)
+        url_base = f'http://{self.headers["Host"]}'
+
+        if url_parts.path == '/harvest/v2/time_entries':
+            page_last = max(1, math.ceil(self.rows / self.page_size))
+            page_cnt = int(url_query.get('page', ['1'])[0])
+            self.reply(self.page('harvest', page_cnt, page_last, url_base))
+        elif url_parts.path == '/lattice/users':
+            page_cnt = int(url_query.get('startingAfter', ['0'])[0]) // self.page_size + 1
+            self.reply(self.page('lattice', page_cnt, max(1, math.ceil(self.rows / self.page_size)), url_base))
+        elif url_parts.path == '/greenhouse/v1/jobs':
+            page_last = max(1, math.ceil(self.rows / self.page_size))
+            page_cnt = int(url_query.get('page', ['1'])[0])
+            if page_cnt in self.failed_pages:
+                self.reply(json.dumps({'message': 'Internal Server Error'}).encode('utf-8'), status=500)
+                return
+
+            # the links keep the filters of the request, like greenhouse does
+            page_link = f'{url_base}/greenhouse/v1/jobs?' + urlencode([
+                (query_key, query_value) for query_key, query_values in url_query.items() if query_key != 'page' for query_value in query_values
+            ])
+            page_links = [f'<{page_link}&page={page_last}>; rel="last"'] if self.greenhouse_last else []
+            if page_cnt < page_last:
+                page_links.insert(0, f'<{page_link}&page={page_cnt + 1}>; rel="next"')
+            self.reply(self.page('greenhouse', page_cnt, page_last, url_base), {'Link': ', '.join(page_links)})
+        elif url_parts.path == '/bamboo/stub/v1/employees/directory':
+            self.reply(self.page('bamboo', 1, 1, url_base))
+        elif url_parts.path.startswith('/salesforce/jobs/query/'):
+            bulk_results = url_parts.path.endswith('/results')
+            if self.salesforceAuthorized('text/csv' if bulk_results else 'application/json'):
+                self.salesforceJob(url_parts.path.split('/')[4], bulk_results, url_query)
+        else:
+            self.reply(b'{}', status=404)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        request_body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        if urlsplit(self.path).path != '/salesforce/jobs/query':
+            self.reply(b'{}', status=404)
+        elif self.salesforceAuthorized('application/json'):
+            bulk_job = f'750{next(self.bulk_ids):015d}'
+            self.bulk_jobs[bulk_job] = request_body['query']
+            self.reply(json.dumps({'id': bulk_job, 'operation': 'query', 'state': 'UploadComplete'}).encode('utf-8'))
+
+    # ¡--- State (json) or csv results of a bulk query job, every job completes right away ---!
+    def salesforceJob(self, bulk_job, bulk_results, url_query):
+        if bulk_job not in self.bulk_jobs:
+            self.reply(b'[{"errorCode": "NOT_FOUND"}]', status=404)
+        elif not bulk_results:
+            self.reply(json.dumps({'id': bulk_job, 'state': 'JobComplete', 'numberRecordsProcessed': self.rows}).encode('utf-8'))
+        else:
+            bulk_start = int(url_query.get('locator', ['0'])[0])
+            bulk_end = min(bulk_start + int(url_query.get('maxRecords', [str(self.rows)])[0]), self.rows)
+            self.reply(self.salesforceCsv(bulk_start, bulk_end), {
+                'Content-Type'              : 'text/csv',
+                'Sforce-Locator'            : str(bulk_end) if bulk_end < self.rows else 'null',
+                'Sforce-NumberOfRecords'    : str(bulk_end - bulk_start),
+            })
+
+    # ¡--- Check the session and the accepted content type of a salesforce request (replies with the error when wrong) ---!
+    # - Sessions whose id starts with expired answer 401 INVALID_SESSION_ID, as an expired salesforce session does
+    def salesforceAuthorized(self, request_accept):
+        if self.headers.get('Authorization', '').startswith('Bearer expired'):
+            self.reply(b'[{"message": "Session expired or invalid", "errorCode": "INVALID_SESSION_ID"}]', status=401)
+        elif self.headers.get('Accept') != request_accept:
+            self.reply(json.dumps([{'message': f'Accept must be {request_accept}', 'errorCode': 'INVALIDHEADER'}]).encode('utf-8'), status=406)
+        else:
+            return True
+
+        return False
+
+    # ¡--- Csv body of a range of bulk query results ---!
+    @classmethod
+    def salesforceCsv(cls, bulk_start, bulk_end):
+        bulk_buffer = io.StringIO()
+        bulk_writer = csv.DictWriter(bulk_buffer, fieldnames=list(salesforceOpportunity(0)), lineterminator='\n')
+        bulk_writer.writeheader()
+        for record_id in range(bulk_start, bulk_end):
+            bulk_writer.writerow({
+                record_key: '' if record_value is None else str(record_value).lower() if isinstance(record_value, bool) else record_value
+                for record_key, record_value in salesforceOpportunity(record_id).items()
+            })
+
+        return bulk_buffer.getvalue().encode('utf-8')
+
+    # ¡--- Body of a page, built once per page and replayed afterwards ---!
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def page(cls, page_vendor, page_cnt, page_last, url_base):
+        page_ids = range((page_cnt - 1) * cls.page_size, min(page_cnt * cls.page_size, cls.rows))
+        if page_vendor == 'bamboo':
+            page_ids = range(cls.rows)
+
+        if page_vendor == 'harvest':
+            page_body = {
+                'time_entries'  : [harvestTimeEntry(page_id) for page_id in page_ids],
+                'per_page'      : cls.page_size,
+                'total_pages'   : page_last,
+                'total_entries' : cls.rows,
+                'page'          : page_cnt,
+                'links'         : {'last': f'{url_base}/harvest/v2/time_entries?from=20240101&page={page_last}&per_page={cls.page_size}&to=20241231'}
+            }
+        elif page_vendor == 'lattice':
+            page_body = {
+                'data'          : [latticeUser(page_id) for page_id in page_ids],
+                'hasMore'       : page_cnt < page_last,
+                'endingCursor'  : str(page_cnt * cls.page_size)
+            }
+        elif page_vendor == 'greenhouse':
+            page_body = [greenhouseJob(page_id) for page_id in page_ids]
+        else:
+            page_body = {'fields': [], 'employees': [bambooEmployee(page_id) for page_id in page_ids]}
+
+        return json.dumps(page_body).encode('utf-8')
+
+    def reply(self, reply_body, reply_headers={}, status=200):
+        self.send_response(status)
+        if 'Content-Type' not in reply_headers:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply_body)))
+        for header_name, header_value in reply_headers.items():
+            self.send_header(header_name, header_value)
+        self.end_headers()
+        self.wfile.write(reply_body)
+
+    def log_message(self, *args):
+        pass
+
+# ¡--- Start the stub server on a free local port ---!
+# - Optional: the total amount of rows per endpoint, the rows per page and the latency added to every request (seconds)
+# - Optional: whether the greenhouse Link header has a rel="last" (otherwise only rel="next") and the pages answered with a 500
+# - Returns the server (call shutdown() to stop it) and its base url, the paths requested are kept in server.paths
+def startStubServer(rows=10000, page_size=100, latency=0.0, greenhouse_last=True, failed_pages=()):
+    stub_handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'rows': rows, 'page_size': page_size, 'latency': latency, 'bulk_jobs': {}, 'bulk_ids': itertools.count(),
+        'greenhouse_last': greenhouse_last, 'failed_pages': frozenset(failed_pages), 'paths': []
+    })
+    stub_server = ThreadingHTTPServer(('127.0.0.1', 0), stub_handler)
+    stub_server.daemon_threads = True
+    stub_server.paths = stub_handler.paths
+    threading.Thread(target=stub_server.serve_forever, daemon=True).start()
+
+    return stub_server, f'http://127.0.0.1:{stub_server.server_port}'
+
+class StubSalesforce:
+    # ¡--- Stand-in of simple_salesforce.Salesforce for the REST queries (no requests are sent) ---!
+    # - Optional: the rows of every query, the rows per REST page, the base url of the stub server and the session id
+    # - The Bulk API 2.0 requests go to the stub server, pass its url as SimpleSF(base_url=...)
+    def __init__(self, rows=10000, page_size=2000, base_url='http://127.0.0.1/salesforce/', session_id='stub-session', **kwargs):
+        self.rows = rows
+        self.page_size = page_size
+        self.base_url = base_url
+        self.session_id = session_id
+        self.sf_instance = urlsplit(base_url).netloc
+        self.calls = []
+
+    def query(self, soql):
+        self.calls.append(('query', soql))
+        return self._page(0)
+
+    def query_more(self, next_records_identifier, identifier_is_url=False):
+        self.calls.append(('query_more', next_records_identifier))
+        return self._page(int(next_records_identifier.rsplit('-', 1)[1]))
+
+    def query_all(self, soql):
+        self.calls.append(('query_all', soql))
+        return {'done': True, 'totalSize': self.rows, 'records': self._records(0, self.rows)}
+
+    def _page(self, page_start):
+        page_end = min(page_start + self.page_size, self.rows)
+        query_page = {'done': page_end >= self.rows, 'totalSize': self.rows, 'records': self._records(page_start, page_end)}
+        if not query_page['done']:
+            query_page['nextRecordsUrl'] = f'/services/data/v59.0/query/01g000000000001-{page_end}'
+
+        return query_page
+
+    def _records(self, page_start, page_end):
+        return [
+            {'attributes': {'type': 'Opportunity'}, **salesforceOpportunity(record_id)}
+            for record_id in range(page_start, page_end)
+        ]
+
+class StubRedshiftClient:
+    # ¡--- Stub of the boto3 redshift-data client, statements finish after the given latency ---!
+    # - Optional: the rows returned by every statement, the rows per result page and the statement latency (seconds)
+    def __init__(self, rows=10000, page_size=1000, latency=0.0):
+        self.rows = rows
+        self.page_size = page_size
+        self.latency = latency
+        self._statements = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def execute_statement(self, **kwargs):
+        with self._lock:
+            statement_id = str(next(self._ids))
+            self._statements[statement_id] = time.monotonic()
+
+        return {'Id': statement_id}
+
+    def describe_statement(self, Id):
+        statement_elapsed = time.monotonic() - self._statements[Id]
+        statement_status = 'FINISHED' if statement_elapsed >= self.latency else 'STARTED'
+
+        return {'Id': Id, 'Status': statement_status, 'HasResultSet': True, 'Duration': int(self.latency * 1e9)}
+
+    def cancel_statement(self, Id):
+        return {'Status': True}
+
+    def get_statement_result(self, Id, NextToken=None):
+        result_start = int(NextToken or 0)
+        result_end = min(result_start + self.page_size, self.rows)
+        statement_result = {
+            'ColumnMetadata': [
+                {'name': 'id', 'typeName': 'int8'},
+                {'name': 'client_name', 'typeName': 'varchar'},
+                {'name': 'hours', 'typeName': 'float8'},
+                {'name': 'billable', 'typeName': 'bool'},
+                {'name': 'spent_date', 'typeName': 'date'},
+            ],
+            'Records': [
+                [
+                    {'longValue': row_id},
+                    {'stringValue': f'Client {row_id % 25}'},
+                    {'doubleValue': (row_id % 16) * 0.25} if row_id % 9 else {'isNull': True},
+                    {'booleanValue': row_id % 2 == 0},
+                    {'stringValue': f'2024-{row_id % 12 + 1:02d}-01'},
+                ]
+                for row_id in range(result_start, result_end)
+            ]
+        }
+        if result_end < self.rows:
+            statement_result['NextToken'] = str(result_end)
+
+        return statement_result
@@ -0,0 +1,42 @@
+import threading
+
+import api_async
+
+class BarrierConnector:
+    # ¡--- Stand-in connector whose calls only return once the given amount of calls are running at the same time ---!
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    def getRecords(self, record_id):
+        self.barrier.wait()
+        return record_id
+
+class AsyncBarrier(api_async.AsyncConnector):
+    vendor = 'harvest'
+
+    def connect(self):
+        return self._args[0]
+
+def test_extract_all_runs_every_allowed_extraction_at_once():
+    # more extractions than the default executor of the loop can run at a time
+    extraction_cnt = 40
+    barrier_connector = BarrierConnector(threading.Barrier(extraction_cnt, timeout=10))
+    extractions = [
+        {'name': extraction_idx, 'connector': AsyncBarrier(barrier_connector), 'method': 'getRecords', 'kwargs': {'record_id': extraction_idx}}
+        for extraction_idx in range(extraction_cnt)
+    ]
+
+    extraction_results = api_async.runExtractions(extractions, {'harvest': extraction_cnt})
+
+    assert extraction_results == {extraction_idx: extraction_idx for extraction_idx in range(extraction_cnt)}
+
+def test_extract_all_keeps_the_vendor_limits():
+    barrier_connector = BarrierConnector(threading.Barrier(3, timeout=0.5))
+    extractions = [
+        {'name': extraction_idx, 'connector': AsyncBarrier(barrier_connector), 'method': 'getRecords', 'kwargs': {'record_id': extraction_idx}}
+        for extraction_idx in range(3)
+    ]
+
+    extraction_results = api_async.runExtractions(extractions, {'harvest': 2})
+
+    assert all(isinstance(extraction_result, threading.BrokenBarrierError) for extraction_result in extraction_results.values())
@@ -0,0 +1,61 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from stub_server import StubRedshiftClient
+
+pytest.importorskip('pandas')
+
+# the module name has a dash, so it's loaded from its path
+aws_spec = importlib.util.spec_from_file_location('api_aws_wip', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api_aws-WIP.py'))
+api_aws = importlib.util.module_from_spec(aws_spec)
+aws_spec.loader.exec_module(api_aws)
+
+CREDENTIALS = {'cluster': 'stub', 'database': 'stub', 'user': 'stub'}
+
+class FailingRedshiftClient(StubRedshiftClient):
+    # ¡--- Stub client where some statements can't be described or read, every cancel is recorded ---!
+    def __init__(self, describe_failures=(), result_failures=(), **kwargs):
+        super().__init__(**kwargs)
+        self.describe_failures = set(describe_failures)
+        self.result_failures = set(result_failures)
+        self.cancelled = []
+
+    def describe_statement(self, Id):
+        if Id in self.describe_failures:
+            raise RuntimeError(f'Throttled describing {Id}')
+        return super().describe_statement(Id)
+
+    def get_statement_result(self, Id, NextToken=None):
+        if Id in self.result_failures:
+            raise RuntimeError(f'Could not read {Id}')
+        return super().get_statement_result(Id, NextToken)
+
+    def cancel_statement(self, Id):
+        self.cancelled.append(Id)
+        return super().cancel_statement(Id)
+
+def test_statement_failures_dont_discard_the_batch():
+    redshift_client = FailingRedshiftClient(describe_failures={'0'}, result_failures={'1'}, rows=5)
+    batch_result = api_aws.redshiftBatch('us-east-1', CREDENTIALS, ['select 0', 'select 1', 'select 2'], client=redshift_client)
+
+    assert batch_result[0]['status'] == 'FAILED' and 'Throttled' in batch_result[0]['error']
+    assert batch_result[1]['status'] == 'FAILED' and 'Could not read' in batch_result[1]['error']
+    assert batch_result[2]['status'] == 'FINISHED' and batch_result[2]['error'] is None
+    assert len(batch_result[2]['result']) == 5
+    assert '0' in redshift_client.cancelled
+
+def test_pending_statements_are_cancelled_on_abort(monkeypatch):
+    def interruptSleep(seconds):
+        raise KeyboardInterrupt
+
+    redshift_client = FailingRedshiftClient(latency=60)
+    monkeypatch.setattr(api_aws.time, 'sleep', interruptSleep)
+
+    with pytest.raises(KeyboardInterrupt):
+        api_aws.redshiftBatch('us-east-1', CREDENTIALS, ['select 0', 'select 1'], client=redshift_client)
+
+    assert sorted(redshift_client.cancelled) == ['0', '1']
@@ -0,0 +1,141 @@
+import os
+import stat
+
+from api_cache import DiskCache, ResponseCache, cachedGet
+from requests.structures import CaseInsensitiveDict
+
+def test_disk_cache_round_trip(tmp_path):
+    disk_cache = DiskCache(str(tmp_path / 'cache'))
+    assert disk_cache.get('key') is None
+
+    disk_cache.set('key', {'value': 1})
+    assert disk_cache.get('key') == {'value': 1}
+
+    disk_cache.delete('key')
+    assert disk_cache.get('key') is None
+
+def test_disk_cache_expands_the_home_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    disk_cache = DiskCache('~/.cache/salesforce', private=True)
+
+    assert disk_cache.cache_dir == str(tmp_path / '.cache' / 'salesforce')
+    assert not os.path.exists(tmp_path / '~')
+
+def test_private_disk_cache_permissions(tmp_path):
+    disk_cache = DiskCache(str(tmp_path / 'sessions'), private=True)
+    disk_cache.set('key', {'session_id': 'secret'})
+
+    assert stat.S_IMODE(os.stat(disk_cache.cache_dir).st_mode) == 0o700
+    assert [stat.S_IMODE(os.stat(os.path.join(disk_cache.cache_dir, cache_file)).st_mode) for cache_file in os.listdir(disk_cache.cache_dir)] == [0o600]
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200, headers=None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    def json(self):
+        return self.payload
+
+class FakeTransport:
+    # answers with the queued responses (or a 200 echoing the url), every request is recorded
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        if self.responses:
+            return self.responses.pop(0)
+
+        return FakeResponse({'url': url}, headers={'ETag': f'"{url}"'})
+
+def test_fresh_entry_skips_the_request():
+    response_cache = ResponseCache(ttl=300)
+    fake_transport = FakeTransport([FakeResponse({'id': 1}, headers={'ETag': '"v1"'})])
+
+    first_response = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+    second_response = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+
+    assert first_response.json() == second_response.json() == {'id': 1}
+    assert second_response.from_cache
+    assert len(fake_transport.requests) == 1
+
+def test_endpoint_ttl_overrides_the_default():
+    response_cache = ResponseCache(ttl=300, endpoint_ttl={'vendor/users': 0})
+    fake_transport = FakeTransport()
+
+    response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+    response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+
+    assert len(fake_transport.requests) == 2
+
+def test_stale_entry_is_revalidated_and_reused_on_304():
+    response_cache = ResponseCache(ttl=0)
+    fake_transport = FakeTransport([
+        FakeResponse({'id': 1}, headers={'ETag': '"v1"', 'Last-Modified': 'Mon, 03 Jun 2024 00:00:00 GMT'}),
+        FakeResponse(None, status_code=304),
+    ])
+
+    response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', headers={'Authorization': 'Bearer a'})
+    revalidated_response = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', headers={'Authorization': 'Bearer a'})
+
+    revalidation_headers = fake_transport.requests[1][1]['headers']
+    assert revalidation_headers['If-None-Match'] == '"v1"'
+    assert revalidation_headers['If-Modified-Since'] == 'Mon, 03 Jun 2024 00:00:00 GMT'
+    assert revalidation_headers['Authorization'] == 'Bearer a'
+    assert revalidated_response.status_code == 200 and revalidated_response.json() == {'id': 1}
+
+def test_failed_responses_are_not_cached():
+    response_cache = ResponseCache(ttl=300)
+    fake_transport = FakeTransport([FakeResponse({'message': 'Unavailable'}, status_code=503)])
+
+    failed_response = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+    assert failed_response.status_code == 503 and not hasattr(failed_response, 'from_cache')
+
+    assert response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users').json() == {'url': 'https://vendor/users'}
+    assert len(fake_transport.requests) == 2
+
+def test_least_recently_used_entry_is_evicted():
+    response_cache = ResponseCache(max_entries=2, ttl=300)
+    fake_transport = FakeTransport()
+
+    for cache_url in ['https://vendor/a', 'https://vendor/b', 'https://vendor/a', 'https://vendor/c']:
+        response_cache.get(fake_transport, cache_url, 'vendor')
+    assert [request_url for request_url, _ in fake_transport.requests] == ['https://vendor/a', 'https://vendor/b', 'https://vendor/c']
+
+    # b was the least recently used one when c came in, a is still cached
+    response_cache.get(fake_transport, 'https://vendor/a', 'vendor')
+    response_cache.get(fake_transport, 'https://vendor/b', 'vendor')
+    assert [request_url for request_url, _ in fake_transport.requests][3:] == ['https://vendor/b']
+
+def test_credentials_are_part_of_the_key():
+    response_cache = ResponseCache(ttl=300)
+    fake_transport = FakeTransport([FakeResponse({'tenant': 'a'}), FakeResponse({'tenant': 'b'}), FakeResponse({'tenant': 'c'})])
+
+    tenant_a = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', headers={'Authorization': 'Bearer a'})
+    tenant_b = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', headers={'Authorization': 'Bearer b'})
+    tenant_c = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', auth=('c', 'secret'))
+
+    assert [tenant_a.json(), tenant_b.json(), tenant_c.json()] == [{'tenant': 'a'}, {'tenant': 'b'}, {'tenant': 'c'}]
+    assert response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users', headers={'Authorization': 'Bearer a'}).json() == {'tenant': 'a'}
+    assert len(fake_transport.requests) == 3
+
+def test_disk_layer_outlives_the_memory_layer(tmp_path):
+    fake_transport = FakeTransport([FakeResponse({'id': 1}, headers={'ETag': '"v1"', 'Link': '<https://vendor/users?page=2>; rel="next"'})])
+    ResponseCache(cache_dir=str(tmp_path / 'responses'), ttl=300).get(fake_transport, 'https://vendor/users', 'vendor/users')
+
+    disk_response = ResponseCache(cache_dir=str(tmp_path / 'responses'), ttl=300).get(fake_transport, 'https://vendor/users', 'vendor/users')
+
+    assert disk_response.json() == {'id': 1}
+    assert disk_response.links['next']['url'] == 'https://vendor/users?page=2'
+    assert len(fake_transport.requests) == 1
+
+def test_cached_get_without_a_cache_goes_straight_to_the_transport():
+    fake_transport = FakeTransport()
+
+    cachedGet(None, fake_transport, 'https://vendor/users', 'vendor/users')
+    cachedGet(None, fake_transport, 'https://vendor/users', 'vendor/users')
+
+    assert len(fake_transport.requests) == 2
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from api_flatten import Flattener, checkFormat, emptyResult
+
+def test_discovers_nested_paths():
+    flattener = Flattener()
+    flattener.extend([{'id': 1, 'client': {'id': 10, 'name': 'Acme'}}])
+
+    flatten_result = flattener.toFrame()
+    assert list(flatten_result.columns) == ['id', 'client.id', 'client.name']
+    assert flatten_result.iloc[0].to_dict() == {'id': 1, 'client.id': 10, 'client.name': 'Acme'}
+
+def test_backfills_paths_found_on_later_pages():
+    flattener = Flattener()
+    flattener.extend([{'id': 1}])
+    flattener.extend([{'id': 2, 'notes': 'late'}])
+
+    assert flattener.toRecords() == [{'id': 1, 'notes': None}, {'id': 2, 'notes': 'late'}]
+
+def test_rolls_back_the_partial_row_on_schema_drift():
+    flattener = Flattener()
+    flattener.extend([{'id': 1, 'invoice': None}, {'id': 2, 'invoice': {'id': 9, 'number': 'A-9'}}])
+
+    assert flattener.rows == 2
+    assert all(len(column_values) == 2 for column_values in flattener.columns.values())
+    assert flattener.toRecords() == [
+        {'id': 1, 'invoice': None, 'invoice.id': None, 'invoice.number': None},
+        {'id': 2, 'invoice': None, 'invoice.id': 9, 'invoice.number': 'A-9'},
+    ]
+
+def test_null_nested_objects_leave_their_children_null():
+    flattener = Flattener()
+    flattener.extend([{'id': 1, 'client': {'id': 10}}, {'id': 2, 'client': None}])
+
+    assert flattener.toRecords()[1] == {'id': 2, 'client.id': None}
+
+def test_request_fields_project_the_records():
+    flattener = Flattener(request_fields=['id', 'client.name', 'missing.field'], separator='_')
+    flattener.extend([{'id': 1, 'hours': 2.0, 'client': {'id': 10, 'name': 'Acme'}}, {'id': 2, 'client': None}])
+
+    assert flattener.toRecords() == [
+        {'id': 1, 'client_name': 'Acme', 'missing_field': None},
+        {'id': 2, 'client_name': None, 'missing_field': None},
+    ]
+
+def test_request_fields_ignore_new_fields():
+    flattener = Flattener(request_fields=['id'])
+    flattener.extend([{'id': 1}, {'id': 2, 'extra': {'nested': True}}])
+
+    assert flattener.paths == [('id',)]
+    assert flattener.toRecords() == [{'id': 1}, {'id': 2}]
+
+def test_frame_dtypes():
+    flattener = Flattener(categories=['client.name'], datetimes=['spent_date'])
+    flattener.extend([
+        {'id': 1, 'billable': True, 'spent_date': '2024-06-01', 'client': {'name': 'Acme'}},
+        {'id': None, 'billable': None, 'spent_date': 'not a date', 'client': {'name': 'Acme'}},
+    ])
+
+    flatten_result = flattener.toFrame()
+    assert str(flatten_result['id'].dtype) == 'Int64'
+    assert str(flatten_result['billable'].dtype) == 'boolean'
+    assert isinstance(flatten_result['client.name'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(flatten_result['spent_date'])
+    assert pd.isna(flatten_result['spent_date'].iloc[1])
+
+def test_drain_keeps_the_paths_and_empties_the_buffers():
+    flattener = Flattener()
+    flattener.extend([{'id': 1, 'name': 'a'}])
+    assert len(flattener.drain()) == 1
+
+    flattener.extend([{'id': 2}])
+    assert flattener.toRecords() == [{'id': 2, 'name': None}]
+
+def test_request_formats():
+    flattener = Flattener()
+    flattener.extend([{'id': 1}])
+
+    assert flattener.toOutput('records') == [{'id': 1}]
+    assert isinstance(flattener.toOutput('pandas'), pd.DataFrame)
+    assert emptyResult('records') == []
+    with pytest.raises(ValueError):
+        checkFormat('json')
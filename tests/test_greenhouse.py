@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+import pytest
+
+from api_greenhouse import Greenhouse
+from api_transport import Transport
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from stub_server import startStubServer
+
+STUB_ROWS = 250
+STUB_PAGE_SIZE = 100
+
+@pytest.fixture
+def stub_greenhouse(tmp_path):
+    # start a stub server with the given options and a connector pointing to it (no retries, failures show at once)
+    stub_servers = []
+
+    def buildGreenhouse(**stub_options):
+        stub_server, stub_url = startStubServer(rows=STUB_ROWS, page_size=STUB_PAGE_SIZE, **stub_options)
+        stub_servers.append(stub_server)
+
+        credentials_path = tmp_path / f'greenhouse-{len(stub_servers)}.json'
+        credentials_path.write_text(json.dumps({'base_url': f'{stub_url}/greenhouse/v1/', 'api_key': 'stub'}))
+        greenhouse = Greenhouse(str(credentials_path))
+        greenhouse.transport = Transport(retry_total=0)
+
+        return greenhouse, stub_server
+
+    yield buildGreenhouse
+    for stub_server in stub_servers:
+        stub_server.shutdown()
+
+def requestedPages(stub_server):
+    return sorted(int(parse_qs(urlsplit(stub_path).query).get('page', ['1'])[0]) for stub_path in stub_server.paths)
+
+def test_last_link_fetches_every_page(stub_greenhouse):
+    greenhouse, stub_server = stub_greenhouse()
+
+    jobs_list = greenhouse.getJobsList(request_format='records')
+
+    assert [job_ent['id'] for job_ent in jobs_list] == list(range(STUB_ROWS))
+    assert requestedPages(stub_server) == [1, 2, 3]
+
+def test_next_links_are_followed_without_a_last_link(stub_greenhouse):
+    greenhouse, stub_server = stub_greenhouse(greenhouse_last=False)
+
+    jobs_list = greenhouse.getJobsList()
+
+    assert list(jobs_list['id']) == list(range(STUB_ROWS))
+    assert requestedPages(stub_server) == [1, 2, 3]
+
+@pytest.mark.parametrize('greenhouse_last', [True, False])
+def test_failed_page_returns_an_empty_result(stub_greenhouse, greenhouse_last):
+    greenhouse, stub_server = stub_greenhouse(greenhouse_last=greenhouse_last, failed_pages={2})
+
+    assert greenhouse.getJobsList(request_format='records') == []
+    assert greenhouse.getJobsList().empty
+
+def test_failed_first_page_returns_an_empty_result(stub_greenhouse):
+    greenhouse, stub_server = stub_greenhouse(failed_pages={1})
+
+    assert greenhouse.getJobsList(request_format='records') == []
+    assert len(stub_server.paths) == 1
+
+@pytest.mark.parametrize('greenhouse_last', [True, False])
+def test_filters_are_encoded_on_every_page(stub_greenhouse, greenhouse_last):
+    greenhouse, stub_server = stub_greenhouse(greenhouse_last=greenhouse_last)
+
+    greenhouse.getJobsList(request_updated_after='2024-01-01T00:00:00+00:00', request_created_after='2023-06-01T00:00:00Z', request_format='records')
+
+    assert len(stub_server.paths) == 3
+    for stub_path in stub_server.paths:
+        assert 'updated_after=2024-01-01T00%3A00%3A00%2B00%3A00' in stub_path
+        stub_query = parse_qs(urlsplit(stub_path).query)
+        assert stub_query['updated_after'] == ['2024-01-01T00:00:00+00:00']
+        assert stub_query['created_after'] == ['2023-06-01T00:00:00Z']
+        assert stub_query['per_page'] == ['500']
@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from api_harvest import Harvest
+from urllib.parse import parse_qs, urlsplit
+
+arrow = pytest.importorskip('arrow')
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+class FakeReportTransport:
+    # client report records by (from, to), a span set to None answers with a 500 and unknown spans are empty
+    def __init__(self, spans):
+        self.spans = spans
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        url_query = parse_qs(urlsplit(url).query)
+        span_records = self.spans.get((url_query['from'][0], url_query['to'][0]), [])
+        if span_records is None:
+            return FakeResponse({'message': 'Internal Server Error'}, status_code=500)
+
+        return FakeResponse({'results': span_records})
+
+    def spansRequested(self):
+        return [(parse_qs(urlsplit(url).query)['from'][0], parse_qs(urlsplit(url).query)['to'][0]) for url in self.urls]
+
+def clientReport(client_id, billable_hours):
+    return {'client_id': client_id, 'client_name': f'Client {client_id}', 'total_hours': billable_hours + 1, 'billable_hours': billable_hours, 'currency': 'USD'}
+
+REPORT_SPANS = {
+    ('20240101', '20240131'): [clientReport(1, 10.0), clientReport(2, 5.0)],
+    ('20240201', '20240229'): [clientReport(1, 20.0)],
+    ('20240301', '20240331'): [clientReport(1, 30.0), clientReport(3, 7.5)],
+}
+REPORT_EXACT = {'start': False, 'end': False}
+
+@pytest.fixture
+def harvest(tmp_path):
+    credentials_path = tmp_path / 'harvest.json'
+    credentials_path.write_text(json.dumps({'user_token': 'token', 'user_id': '1', 'user_agent': 'tests'}))
+
+    return Harvest(str(credentials_path))
+
+def reportRows(report_frame):
+    return report_frame.sort_values('client_id').to_dict('records')
+
+def test_merged_report_sums_every_span(harvest):
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+
+    report_frame = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, True)
+
+    assert sorted(harvest.transport.spansRequested()) == sorted(REPORT_SPANS)
+    assert reportRows(report_frame) == [
+        {'client_id': 1, 'client_name': 'Client 1', 'billable_hours': 60.0},
+        {'client_id': 2, 'client_name': 'Client 2', 'billable_hours': 5.0},
+        {'client_id': 3, 'client_name': 'Client 3', 'billable_hours': 7.5},
+    ]
+
+def test_report_per_span_keeps_one_column_per_span(harvest):
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+
+    report_frame = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, False)
+
+    assert list(report_frame.columns) == ['client_id', 'client_name', 'billable_hours_1', 'billable_hours_2', 'billable_hours_3']
+    assert reportRows(report_frame) == [
+        {'client_id': 1, 'client_name': 'Client 1', 'billable_hours_1': 10.0, 'billable_hours_2': 20.0, 'billable_hours_3': 30.0},
+        {'client_id': 2, 'client_name': 'Client 2', 'billable_hours_1': 5.0, 'billable_hours_2': 0.0, 'billable_hours_3': 0.0},
+        {'client_id': 3, 'client_name': 'Client 3', 'billable_hours_1': 0.0, 'billable_hours_2': 0.0, 'billable_hours_3': 7.5},
+    ]
+
+def test_report_per_span_keeps_empty_spans(harvest):
+    harvest.transport = FakeReportTransport({('20240101', '20240131'): [clientReport(1, 10.0)]})
+
+    report_frame = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-02-29'), 'month', REPORT_EXACT, False)
+
+    assert reportRows(report_frame) == [{'client_id': 1, 'client_name': 'Client 1', 'billable_hours_1': 10.0, 'billable_hours_2': 0.0}]
+
+def test_single_span_report_is_never_split(harvest):
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+
+    report_frame = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-01-31'), 'month', REPORT_EXACT, False)
+
+    assert reportRows(report_frame) == [
+        {'client_id': 1, 'client_name': 'Client 1', 'billable_hours': 10.0},
+        {'client_id': 2, 'client_name': 'Client 2', 'billable_hours': 5.0},
+    ]
+
+def test_exact_dates_trim_the_first_and_last_spans(harvest):
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+
+    harvest.getTimeReportClientsFull(arrow.get('2024-01-15'), arrow.get('2024-03-10'), 'month', {'start': True, 'end': True}, True)
+
+    assert sorted(harvest.transport.spansRequested()) == [('20240115', '20240131'), ('20240201', '20240229'), ('20240301', '20240310')]
+
+def test_failed_span_returns_an_empty_result(harvest):
+    harvest.transport = FakeReportTransport({**REPORT_SPANS, ('20240201', '20240229'): None})
+
+    assert harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, True) == []
+
+def test_invalid_span_raises(harvest):
+    with pytest.raises(ValueError, match='request_span'):
+        harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'week', REPORT_EXACT, True)
+
+def test_closed_spans_are_served_from_the_cache(harvest, tmp_path):
+    report_cache = str(tmp_path / 'reports')
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+    first_report = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, False, request_cache=report_cache)
+
+    harvest.transport = FakeReportTransport({})
+    second_report = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, False, request_cache=report_cache)
+
+    assert harvest.transport.urls == []
+    assert reportRows(second_report) == reportRows(first_report)
+
+def test_open_span_is_always_requested(harvest, tmp_path):
+    report_cache = str(tmp_path / 'reports')
+    report_start, report_end = arrow.now().shift(months=-1).floor('month'), arrow.now().ceil('month')
+    report_open = (report_end.floor('month').format('YYYYMMDD'), report_end.format('YYYYMMDD'))
+
+    for _ in range(2):
+        harvest.transport = FakeReportTransport({})
+        harvest.getTimeReportClientsFull(report_start, report_end, 'month', REPORT_EXACT, True, request_cache=report_cache)
+
+    assert harvest.transport.spansRequested() == [report_open]
+
+def test_failed_spans_are_not_cached(harvest, tmp_path):
+    report_cache = str(tmp_path / 'reports')
+    harvest.transport = FakeReportTransport({**REPORT_SPANS, ('20240201', '20240229'): None})
+    harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, True, request_cache=report_cache)
+
+    harvest.transport = FakeReportTransport(REPORT_SPANS)
+    report_frame = harvest.getTimeReportClientsFull(arrow.get('2024-01-01'), arrow.get('2024-03-31'), 'month', REPORT_EXACT, True, request_cache=report_cache)
+
+    assert harvest.transport.spansRequested() == [('20240201', '20240229')]
+    assert reportRows(report_frame)[0]['billable_hours'] == 60.0
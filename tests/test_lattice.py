@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from api_lattice import Lattice
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+class FakeTransport:
+    # cursor pages in order, a page set to None answers with a 500
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, **kwargs):
+        page_cnt = int(url.split('&startingAfter=')[1]) if '&startingAfter=' in url else 0
+        if self.pages[page_cnt] is None:
+            return FakeResponse({}, status_code=500)
+
+        return FakeResponse({'data': self.pages[page_cnt], 'hasMore': page_cnt + 1 < len(self.pages), 'endingCursor': str(page_cnt + 1)})
+
+@pytest.fixture
+def lattice(tmp_path):
+    credentials_path = tmp_path / 'lattice.json'
+    credentials_path.write_text(json.dumps({'base_url': 'https://lattice.test/v1', 'api_key': 'key'}))
+
+    return Lattice(str(credentials_path))
+
+def test_iter_users_yields_every_page(lattice):
+    lattice.transport = FakeTransport([[{'id': 1}], [{'id': 2}]])
+    assert [list(chunk_ent['id']) for chunk_ent in lattice.iterUsers()] == [[1], [2]]
+
+def test_iter_users_raises_when_a_page_fails(lattice):
+    lattice.transport = FakeTransport([[{'id': 1}], None, [{'id': 3}]])
+    users_chunks = lattice.iterUsers()
+
+    assert list(next(users_chunks)['id']) == [1]
+    with pytest.raises(RuntimeError):
+        next(users_chunks)
+
+def test_get_users_returns_an_empty_result_when_a_page_fails(lattice):
+    lattice.transport = FakeTransport([[{'id': 1}], None])
+    assert lattice.getListAllUsers(request_format='records') == []
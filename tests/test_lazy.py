@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the connectors are imported and called in a fresh interpreter, the test process has pandas loaded already
+LAZY_SCRIPT = textwrap.dedent('''
+    import sys, tempfile
+    sys.path[:0] = [{repo_dir!r}, {benchmarks_dir!r}]
+    from stub_server import startStubServer
+    from run_benchmarks import buildConnector
+
+    stub_server, base_url = startStubServer(rows=250, page_size=100)
+    credentials_dir = tempfile.mkdtemp()
+    records = {{
+        'harvest'   : buildConnector('harvest', base_url, credentials_dir).getTimeEntries('20240101', '20241231', request_format='records'),
+        'lattice'   : buildConnector('lattice', base_url, credentials_dir).getListAllUsers(request_format='records'),
+        'greenhouse': buildConnector('greenhouse', base_url, credentials_dir).getJobsList(request_format='records'),
+        'bamboo'    : buildConnector('bamboo', base_url, credentials_dir).getEmployeesDirectory(request_format='records'),
+    }}
+    stub_server.shutdown()
+
+    assert all(len(vendor_records) == 250 for vendor_records in records.values()), {{vendor_name: len(vendor_records) for vendor_name, vendor_records in records.items()}}
+    print(sorted(module_name for module_name in ('pandas', 'pyarrow', 'numpy') if module_name in sys.modules))
+''')
+
+def test_records_format_never_imports_pandas():
+    lazy_process = subprocess.run(
+        [sys.executable, '-c', LAZY_SCRIPT.format(repo_dir=REPO_DIR, benchmarks_dir=os.path.join(REPO_DIR, 'benchmarks'))],
+        capture_output=True, text=True, timeout=60
+    )
+
+    assert lazy_process.returncode == 0, lazy_process.stderr
+    assert lazy_process.stdout.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+import api_metrics
+from api_cache import ResponseCache
+from api_harvest import Harvest
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = {}
+        self.content = json.dumps(payload).encode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+class FakeHarvestTransport:
+    # three pages of time entries
+    def get(self, url, **kwargs):
+        page_cnt = int(url.rsplit('&page=', 1)[1]) if '&page=' in url else 1
+        return FakeResponse({'time_entries': [{'id': page_cnt, 'hours': 1.0}], 'total_pages': 3})
+
+@pytest.fixture
+def memory_sink():
+    memory_sink = api_metrics.addSink(api_metrics.MemorySink())
+    yield memory_sink
+    api_metrics.removeSink(memory_sink)
+
+def test_emit_without_sinks_does_nothing():
+    assert not api_metrics.metricsEnabled()
+    api_metrics.emit('request', {'host': 'vendor'}, seconds=1.0)
+
+def test_memory_sink_aggregates_per_event_and_labels(memory_sink):
+    api_metrics.emit('request', {'host': 'a', 'status': '200'}, seconds=1.0, bytes=100)
+    api_metrics.emit('request', {'status': '200', 'host': 'a'}, seconds=3.0, bytes=None)
+    api_metrics.emit('request', {'host': 'b', 'status': '200'}, seconds=2.0, bytes=50)
+    api_metrics.emit('normalize', {'name': 'records'}, seconds=0.5, rows=10)
+
+    request_series = sorted(memory_sink.summary('request'), key=lambda series_ent: series_ent['labels']['host'])
+    assert [series_ent['count'] for series_ent in request_series] == [2, 1]
+    assert request_series[0]['values']['seconds'] == {'sum': 4.0, 'min': 1.0, 'max': 3.0}
+    assert request_series[0]['values']['bytes'] == {'sum': 100, 'min': 100, 'max': 100}
+    assert memory_sink.total('request', 'seconds') == 6.0
+    assert memory_sink.total('normalize', 'rows') == 10
+    assert memory_sink.total('frame', 'seconds') == 0
+
+    memory_sink.clear()
+    assert memory_sink.summary() == []
+
+def test_failing_sink_never_breaks_the_caller(memory_sink):
+    def failingCallback(event_name, event_labels, event_values):
+        raise RuntimeError('sink down')
+
+    failing_sink = api_metrics.addSink(api_metrics.CallbackSink(failingCallback))
+    try:
+        api_metrics.emit('request', {'host': 'a'}, seconds=1.0)
+    finally:
+        api_metrics.removeSink(failing_sink)
+
+    assert memory_sink.total('request', 'seconds') == 1.0
+
+def test_callback_sink_receives_every_event():
+    callback_events = []
+    callback_sink = api_metrics.addSink(api_metrics.CallbackSink(lambda *event_ent: callback_events.append(event_ent)))
+    api_metrics.emit('page', {'name': 'vendor'}, seconds=0.25)
+    api_metrics.removeSink(callback_sink)
+    api_metrics.emit('page', {'name': 'vendor'}, seconds=0.5)
+
+    assert callback_events == [('page', {'name': 'vendor'}, {'seconds': 0.25})]
+    assert not api_metrics.metricsEnabled()
+
+def test_prometheus_export_groups_the_series_per_metric():
+    prometheus_sink = api_metrics.PrometheusSink()
+    prometheus_sink.record('request', {'host': 'a', 'status': '200'}, {'seconds': 1.5})
+    prometheus_sink.record('request', {'host': 'b', 'status': '429'}, {'seconds': 0.5})
+    prometheus_sink.record('page', {'name': 'say "hi"\\n'}, {'seconds': 0.25})
+
+    assert prometheus_sink.export().splitlines() == [
+        '# TYPE api_page_seconds_max gauge',
+        'api_page_seconds_max{name="say \\"hi\\"\\\\n"} 0.25',
+        '# TYPE api_page_seconds_sum counter',
+        'api_page_seconds_sum{name="say \\"hi\\"\\\\n"} 0.25',
+        '# TYPE api_page_total counter',
+        'api_page_total{name="say \\"hi\\"\\\\n"} 1',
+        '# TYPE api_request_seconds_max gauge',
+        'api_request_seconds_max{host="a",status="200"} 1.5',
+        'api_request_seconds_max{host="b",status="429"} 0.5',
+        '# TYPE api_request_seconds_sum counter',
+        'api_request_seconds_sum{host="a",status="200"} 1.5',
+        'api_request_seconds_sum{host="b",status="429"} 0.5',
+        '# TYPE api_request_total counter',
+        'api_request_total{host="a",status="200"} 1',
+        'api_request_total{host="b",status="429"} 1',
+    ]
+
+def test_prometheus_textfile_is_written(tmp_path):
+    prometheus_sink = api_metrics.PrometheusSink(metrics_prefix='etl')
+    prometheus_sink.record('request', {}, {'seconds': 1.0})
+    prometheus_sink.writeTextfile(str(tmp_path / 'api.prom'))
+
+    assert (tmp_path / 'api.prom').read_text() == prometheus_sink.export()
+    assert 'etl_request_total 1' in prometheus_sink.export()
+
+def test_page_json_reports_every_decoded_page(memory_sink):
+    page_response = FakeResponse({'data': [1, 2, 3]})
+
+    assert api_metrics.pageJson(page_response, 'vendor/users') == {'data': [1, 2, 3]}
+    page_series = memory_sink.summary('page')
+    assert [(series_ent['labels'], series_ent['count']) for series_ent in page_series] == [({'name': 'vendor/users'}, 1)]
+    assert page_series[0]['values']['bytes']['sum'] == len(page_response.content)
+    assert page_series[0]['values']['seconds']['sum'] >= 0
+
+def test_cached_pages_are_reported_once(memory_sink):
+    response_cache = ResponseCache(ttl=300)
+    fake_transport = FakeHarvestTransport()
+
+    for _ in range(2):
+        cached_response = response_cache.get(fake_transport, 'https://vendor/users', 'vendor/users')
+        api_metrics.pageJson(cached_response, 'vendor/users')
+
+    assert [series_ent['count'] for series_ent in memory_sink.summary('page')] == [1]
+
+def test_time_entries_report_one_page_event_per_page(memory_sink, tmp_path):
+    credentials_path = tmp_path / 'harvest.json'
+    credentials_path.write_text(json.dumps({'user_token': 'token', 'user_id': '1', 'user_agent': 'tests'}))
+    harvest = Harvest(str(credentials_path))
+    harvest.transport = FakeHarvestTransport()
+
+    assert len(harvest.getTimeEntries('20240101', '20241231', request_format='records')) == 3
+    assert memory_sink.summary('page')[0]['labels'] == {'name': 'harvest/time_entries'}
+    assert memory_sink.summary('page')[0]['count'] == 3
+    assert memory_sink.summary('normalize')[0]['values']['rows']['sum'] == 3
+
+def test_client_report_is_normalized_through_the_hooks(memory_sink, tmp_path):
+    credentials_path = tmp_path / 'harvest.json'
+    credentials_path.write_text(json.dumps({'user_token': 'token', 'user_id': '1', 'user_agent': 'tests'}))
+    harvest = Harvest(str(credentials_path))
+    harvest.transport = type('FakeReportTransport', (), {
+        'get': lambda self, url, **kwargs: FakeResponse({'results': [{'client_id': 1, 'client_name': 'Client 1', 'billable_hours': 2.5}]})
+    })()
+
+    report_frame = harvest.getTimeReportClientsSimple('20240101', '20240131')
+
+    assert report_frame.to_dict('records') == [{'client_id': 1, 'client_name': 'Client 1', 'billable_hours': 2.5}]
+    assert [series_ent['labels']['name'] for series_ent in memory_sink.summary('normalize')] == ['harvest/reports/time/clients']
+    assert [series_ent['labels']['name'] for series_ent in memory_sink.summary('page')] == ['harvest/reports/time/clients']
@@ -0,0 +1,96 @@
+import json
+import os
+
+import pytest
+
+from api_registry import ConnectorRegistry, clearRegistry, loadCredentials
+
+class Connector(metaclass=ConnectorRegistry):
+    builds = []
+
+    def __init__(self, credentials_path, options=None, page_size=100):
+        self.credentials = loadCredentials(credentials_path)
+        self.options = options
+        Connector.builds.append(self)
+
+@pytest.fixture(autouse=True)
+def registry():
+    clearRegistry()
+    Connector.builds.clear()
+    yield
+    clearRegistry()
+
+@pytest.fixture
+def credentials_path(tmp_path):
+    credentials_path = tmp_path / 'credentials.json'
+    credentials_path.write_text(json.dumps({'api_key': 'first'}))
+
+    return str(credentials_path)
+
+def touchCredentials(credentials_path, credentials_items):
+    # a new modification time, even on file systems with a coarse clock
+    credentials_stat = os.stat(credentials_path)
+    with open(credentials_path, 'w') as credentials_file:
+        json.dump(credentials_items, credentials_file)
+    os.utime(credentials_path, ns=(credentials_stat.st_atime_ns, credentials_stat.st_mtime_ns + 10 ** 9))
+
+def test_same_credentials_return_the_same_instance(credentials_path):
+    assert Connector(credentials_path) is Connector(credentials_path)
+    assert len(Connector.builds) == 1
+
+def test_default_arguments_share_the_instance(credentials_path):
+    assert Connector(credentials_path) is Connector(credentials_path, options=None)
+    assert Connector(credentials_path, None) is Connector(credentials_path, page_size=100)
+
+def test_other_arguments_build_another_instance(credentials_path):
+    assert Connector(credentials_path, options='a') is not Connector(credentials_path, options='b')
+    assert len(Connector.builds) == 2
+
+def test_relative_and_real_paths_share_the_instance(credentials_path, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(credentials_path))
+
+    assert Connector(credentials_path) is Connector(os.path.basename(credentials_path))
+
+def test_edited_credentials_build_a_new_instance(credentials_path):
+    first_connector = Connector(credentials_path)
+    touchCredentials(credentials_path, {'api_key': 'second'})
+    second_connector = Connector(credentials_path)
+
+    assert first_connector is not second_connector
+    assert second_connector.credentials == {'api_key': 'second'}
+
+def test_unhashable_arguments_skip_the_registry(credentials_path):
+    assert Connector(credentials_path, options={'page_size': 100}) is not Connector(credentials_path, options={'page_size': 100})
+    assert len(Connector.builds) == 2
+
+def test_failed_construction_is_tried_again(credentials_path):
+    class FlakyConnector(metaclass=ConnectorRegistry):
+        attempts = []
+
+        def __init__(self, credentials_path):
+            FlakyConnector.attempts.append(credentials_path)
+            if len(FlakyConnector.attempts) == 1:
+                raise RuntimeError('login failed')
+
+    with pytest.raises(RuntimeError):
+        FlakyConnector(credentials_path)
+
+    assert FlakyConnector(credentials_path) is FlakyConnector(credentials_path)
+    assert len(FlakyConnector.attempts) == 2
+
+def test_clear_registry_forgets_the_instances(credentials_path):
+    first_connector = Connector(credentials_path)
+    clearRegistry()
+
+    assert Connector(credentials_path) is not first_connector
+
+def test_load_credentials_returns_a_copy(credentials_path):
+    loadCredentials(credentials_path)['api_key'] = 'changed'
+
+    assert loadCredentials(credentials_path) == {'api_key': 'first'}
+
+def test_load_credentials_reads_the_file_again_once_edited(credentials_path):
+    assert loadCredentials(credentials_path) == {'api_key': 'first'}
+    touchCredentials(credentials_path, {'api_key': 'second'})
+
+    assert loadCredentials(credentials_path) == {'api_key': 'second'}
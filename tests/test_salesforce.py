@@ -0,0 +1,146 @@
+import itertools
+import json
+import os
+import sys
+import types
+
+import pytest
+
+import api_salesforce
+
+from api_registry import clearRegistry
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+from stub_server import StubSalesforce, startStubServer
+
+STUB_ROWS = 250
+
+class SalesforceExpiredSession(Exception):
+    pass
+
+@pytest.fixture(scope='module')
+def stub_url():
+    stub_server, stub_url = startStubServer(rows=STUB_ROWS)
+    yield stub_url
+    stub_server.shutdown()
+
+@pytest.fixture
+def salesforce_logins(monkeypatch):
+    # every login gets a new session, the ids listed in expired_sessions are rejected by the stub server
+    # - clients built out of a stored session (session_id=...) keep it and are listed in reused_sessions
+    salesforce_logins = {'clients': [], 'expired_sessions': set(), 'reused_sessions': [], 'page_size': 100}
+    session_ids = itertools.count()
+
+    def stubLogin(**kwargs):
+        if 'session_id' in kwargs:
+            session_id = kwargs['session_id']
+            salesforce_logins['reused_sessions'].append(session_id)
+        else:
+            session_id = f'stub-{next(session_ids)}'
+        if session_id in salesforce_logins['expired_sessions']:
+            session_id = f'expired-{session_id}'
+        salesforce_client = StubSalesforce(rows=STUB_ROWS, page_size=salesforce_logins['page_size'], session_id=session_id)
+        salesforce_logins['clients'].append(salesforce_client)
+
+        return salesforce_client
+
+    monkeypatch.setattr(api_salesforce, 'simple_salesforce', types.SimpleNamespace(Salesforce=stubLogin, SalesforceExpiredSession=SalesforceExpiredSession))
+    return salesforce_logins
+
+@pytest.fixture
+def simple_sf(tmp_path, stub_url, salesforce_logins):
+    credentials_path = tmp_path / 'salesforce.json'
+    credentials_path.write_text(json.dumps({'user_name': 'user', 'user_password': 'password', 'security_token': 'token'}))
+
+    return api_salesforce.SimpleSF(str(credentials_path), base_url=f'{stub_url}/salesforce/')
+
+def test_bulk_chunks_are_complete_and_share_dtypes(simple_sf):
+    bulk_chunks = list(simple_sf.sfIterQueryBulk('SELECT Id FROM Opportunity', request_chunk=100, request_mode='bulk', request_dtypes={'Amount': 'Float64', 'IsClosed': 'boolean'}))
+
+    assert [len(chunk_ent) for chunk_ent in bulk_chunks] == [100, 100, 50]
+    assert all(chunk_ent.dtypes.equals(bulk_chunks[0].dtypes) for chunk_ent in bulk_chunks)
+    assert str(bulk_chunks[0]['Amount'].dtype) == 'Float64'
+    assert str(bulk_chunks[0]['IsClosed'].dtype) == 'boolean'
+    assert str(bulk_chunks[0]['Id'].dtype) == 'string'
+    assert bulk_chunks[2]['Id'].iloc[-1] == f'006{STUB_ROWS - 1:015d}'
+
+def test_auto_mode_reuses_the_first_rest_page(simple_sf, salesforce_logins):
+    query_result = simple_sf.sfQueryBulk('SELECT Id FROM Opportunity', request_chunk=100, request_threshold=STUB_ROWS)
+
+    assert len(query_result) == STUB_ROWS
+    assert 'attributes' not in query_result.columns
+    assert [call_ent[0] for call_ent in salesforce_logins['clients'][0].calls] == ['query', 'query_more', 'query_more']
+
+def test_auto_mode_creates_a_bulk_job_above_the_threshold(simple_sf, salesforce_logins):
+    query_result = simple_sf.sfQueryBulk('SELECT Id FROM Opportunity', request_chunk=100, request_threshold=10)
+
+    assert len(query_result) == STUB_ROWS
+    assert [call_ent[0] for call_ent in salesforce_logins['clients'][0].calls] == ['query']
+
+def test_bulk_job_signs_in_again_when_the_session_expired(stub_url, salesforce_logins, tmp_path):
+    salesforce_logins['expired_sessions'].add('stub-0')
+    credentials_path = tmp_path / 'salesforce.json'
+    credentials_path.write_text(json.dumps({'user_name': 'user', 'user_password': 'password', 'security_token': 'token'}))
+    expired_sf = api_salesforce.SimpleSF(str(credentials_path), base_url=f'{stub_url}/salesforce/')
+
+    assert expired_sf.credentials.session_id.startswith('expired')
+    assert sum(len(chunk_ent) for chunk_ent in expired_sf.sfIterQueryBulk('SELECT Id FROM Opportunity', request_mode='bulk')) == STUB_ROWS
+    assert not expired_sf.credentials.session_id.startswith('expired')
+
+def test_bulk_results_written_to_parquet(simple_sf, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    output_path = str(tmp_path / 'opportunities.parquet')
+
+    assert simple_sf.sfQueryBulk('SELECT Id FROM Opportunity', request_chunk=100, request_mode='bulk', output_path=output_path) == STUB_ROWS
+    assert pq.read_table(output_path).num_rows == STUB_ROWS
+
+@pytest.fixture
+def credentials_path(tmp_path):
+    credentials_path = tmp_path / 'salesforce.json'
+    credentials_path.write_text(json.dumps({'user_name': 'user', 'user_password': 'password', 'security_token': 'token'}))
+
+    return str(credentials_path)
+
+def test_registry_reuses_the_instance_and_its_login(credentials_path, salesforce_logins, tmp_path):
+    first_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+    second_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+
+    assert first_sf is second_sf
+    assert len(salesforce_logins['clients']) == 1
+
+def test_stored_session_is_reused_by_other_instances(credentials_path, salesforce_logins, tmp_path):
+    first_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+    # a new process starts with an empty registry
+    clearRegistry()
+    second_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+
+    assert first_sf is not second_sf
+    assert second_sf.credentials.session_id == first_sf.credentials.session_id == 'stub-0'
+    assert salesforce_logins['reused_sessions'] == ['stub-0']
+
+def test_stored_session_is_not_trusted_after_its_ttl(credentials_path, salesforce_logins, tmp_path):
+    api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'), session_ttl=0)
+    clearRegistry()
+    second_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'), session_ttl=0)
+
+    assert second_sf.credentials.session_id == 'stub-1'
+    assert salesforce_logins['reused_sessions'] == []
+
+def test_expired_stored_session_is_replaced(credentials_path, salesforce_logins, tmp_path):
+    first_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+    first_sf._sfRefresh('stub-0')
+
+    # the new session is stored, a later instance reuses it instead of the expired one
+    clearRegistry()
+    second_sf = api_salesforce.SimpleSF(credentials_path, session_dir=str(tmp_path / 'sessions'))
+
+    assert first_sf.credentials.session_id == second_sf.credentials.session_id == 'stub-1'
+    assert salesforce_logins['reused_sessions'] == ['stub-1']
+
+def test_refresh_only_replaces_the_session_that_expired(credentials_path, salesforce_logins):
+    simple_sf = api_salesforce.SimpleSF(credentials_path)
+    simple_sf._sfRefresh('stub-0')
+    simple_sf._sfRefresh('stub-0')
+
+    assert simple_sf.credentials.session_id == 'stub-1'
+    assert len(salesforce_logins['clients']) == 2
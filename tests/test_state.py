@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from api_harvest import Harvest
+from api_state import SyncStore
+
+def timeEntry(entry_id, updated_at, hours=1.0):
+    return {'id': entry_id, 'updated_at': updated_at, 'hours': hours}
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+class FakeTransport:
+    # pages of time entries by page number, a page set to None answers with a 500
+    # - the links are built like harvest's, with the query keys sorted (page comes first when there are no dates)
+    def __init__(self, pages):
+        self.pages = pages
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        url_query = {query_key: query_values[0] for query_key, query_values in parse_qs(urlsplit(url).query).items()}
+        page_cnt = int(url_query.pop('page', 1))
+        if self.pages[page_cnt] is None:
+            return FakeResponse({'message': 'Internal Server Error'}, status_code=500)
+
+        page_link = urlencode(sorted({**url_query, 'page': len(self.pages), 'per_page': 2000}.items()))
+        return FakeResponse({
+            'time_entries'  : self.pages[page_cnt],
+            'total_pages'   : len(self.pages),
+            'links'         : {'last': f'https://api.harvestapp.com/v2/time_entries?{page_link}'}
+        })
+
+@pytest.fixture
+def harvest(tmp_path):
+    credentials_path = tmp_path / 'harvest.json'
+    credentials_path.write_text(json.dumps({'user_token': 'token', 'user_id': '1', 'user_agent': 'tests'}))
+
+    return Harvest(str(credentials_path))
+
+def test_watermark_starts_empty(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        assert sync_store.getWatermark('resource') is None
+
+def test_set_watermark_only_moves_forward(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        sync_store.setWatermark('resource', '2024-06-05T00:00:00Z')
+        sync_store.setWatermark('resource', '2024-06-01T00:00:00Z')
+        sync_store.setWatermark('resource', None)
+        assert sync_store.getWatermark('resource') == '2024-06-05T00:00:00Z'
+
+        sync_store.setWatermark('resource', '2024-06-07T00:00:00Z')
+        assert sync_store.getWatermark('resource') == '2024-06-07T00:00:00Z'
+
+def test_upsert_returns_only_new_or_changed_records(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        first_records = [timeEntry(1, '2024-06-01T00:00:00Z'), timeEntry(2, '2024-06-02T00:00:00Z')]
+        assert sync_store.upsertRecords('resource', first_records) == first_records
+
+        second_records = [timeEntry(1, '2024-06-01T00:00:00Z'), timeEntry(2, '2024-06-03T00:00:00Z', hours=2.0)]
+        assert sync_store.upsertRecords('resource', second_records) == [second_records[1]]
+        assert sync_store.getRecords('resource') == [first_records[0], second_records[1]]
+
+def test_upsert_leaves_the_watermark_alone(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        sync_store.upsertRecords('resource', [timeEntry(1, '2024-06-01T00:00:00Z')])
+        assert sync_store.getWatermark('resource') is None
+
+def test_records_are_kept_per_resource(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        sync_store.upsertRecords('resource_a', [timeEntry(1, '2024-06-01T00:00:00Z')])
+        assert sync_store.getRecords('resource_b') == []
+        assert sync_store.upsertRecords('resource_b', [timeEntry(1, '2024-06-01T00:00:00Z')]) != []
+
+def test_store_persists_between_connections(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        sync_store.upsertRecords('resource', [timeEntry(1, '2024-06-01T00:00:00Z')])
+        sync_store.setWatermark('resource', '2024-06-01T00:00:00Z')
+
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        assert sync_store.getWatermark('resource') == '2024-06-01T00:00:00Z'
+        assert len(sync_store.getRecords('resource')) == 1
+
+def test_transaction_rolls_back_every_write_on_error(tmp_path):
+    with SyncStore(str(tmp_path / 'sync.db')) as sync_store:
+        with pytest.raises(RuntimeError):
+            with sync_store.transaction():
+                sync_store.upsertRecords('resource', [timeEntry(1, '2024-06-01T00:00:00Z')])
+                sync_store.setWatermark('resource', '2024-06-01T00:00:00Z')
+                raise RuntimeError('page failed')
+
+        assert sync_store.getRecords('resource') == []
+        assert sync_store.getWatermark('resource') is None
+
+        with sync_store.transaction():
+            sync_store.upsertRecords('resource', [timeEntry(1, '2024-06-01T00:00:00Z')])
+        assert len(sync_store.getRecords('resource')) == 1
+
+def test_sync_stores_the_latest_update_of_every_page(harvest, tmp_path):
+    store_path = str(tmp_path / 'sync.db')
+    harvest.transport = FakeTransport({
+        1: [timeEntry(1, '2024-06-05T00:00:00Z')],
+        2: [timeEntry(2, '2024-06-07T00:00:00Z')],
+        3: [timeEntry(3, '2024-06-02T00:00:00Z')],
+    })
+
+    assert len(harvest.syncTimeEntries(store_path, request_workers=1)) == 3
+    with SyncStore(store_path) as sync_store:
+        assert sync_store.getWatermark(harvest._syncResource(None, None)) == '2024-06-07T00:00:00Z'
+
+def test_sync_reads_every_page_when_page_leads_the_links(harvest, tmp_path):
+    harvest.transport = FakeTransport({page_cnt: [timeEntry(page_cnt, '2024-06-01T00:00:00Z')] for page_cnt in range(1, 4)})
+
+    sync_result = harvest.syncTimeEntries(str(tmp_path / 'sync.db'), request_workers=2)
+
+    assert harvest.transport.get(harvest.transport.urls[0]).json()['links']['last'].split('?')[1].startswith('page=')
+    assert list(sync_result['id']) == [1, 2, 3]
+
+def test_get_time_entries_reads_every_page(harvest):
+    harvest.transport = FakeTransport({page_cnt: [timeEntry(page_cnt, '2024-06-01T00:00:00Z')] for page_cnt in range(1, 4)})
+
+    time_entries_result = harvest.getTimeEntries('20240101', '20241231', request_format='records')
+
+    assert [time_entry['id'] for time_entry in time_entries_result] == [1, 2, 3]
+    assert all('from=20240101' in page_url for page_url in harvest.transport.urls)
+
+def test_failed_page_raises_with_its_number(harvest):
+    harvest.transport = FakeTransport({1: [timeEntry(1, '2024-06-01T00:00:00Z')], 2: None})
+
+    with pytest.raises(RuntimeError, match='page 2 of 2'):
+        harvest.getTimeEntries('20240101', '20241231')
+    with pytest.raises(RuntimeError, match='page 2 of 2'):
+        list(harvest.iterTimeEntries('20240101', '20241231'))
+
+def test_failed_first_page_returns_an_empty_result_of_the_format(harvest):
+    harvest.transport = FakeTransport({1: None})
+
+    assert harvest.getTimeEntries('20240101', '20241231', request_format='records') == []
+    assert harvest.getTimeEntries('20240101', '20241231').empty
+
+def test_failed_sync_keeps_the_previous_watermark(harvest, tmp_path):
+    store_path = str(tmp_path / 'sync.db')
+    sync_pages = {
+        1: [timeEntry(1, '2024-06-05T00:00:00Z')],
+        2: [timeEntry(2, '2024-06-01T00:00:00Z')],
+        3: None,
+    }
+    harvest.transport = FakeTransport(sync_pages)
+
+    with pytest.raises(RuntimeError, match=r'status 500 \(page 3 of 3\)'):
+        harvest.syncTimeEntries(store_path, request_workers=1)
+    with SyncStore(store_path) as sync_store:
+        assert sync_store.getWatermark(harvest._syncResource(None, None)) is None
+
+        assert sync_store.getRecords(harvest._syncResource(None, None)) == []
+
+    # the next run pulls every page again and reports the entries of every page, not only the failed one
+    sync_pages[3] = [timeEntry(3, '2024-06-02T00:00:00Z')]
+    harvest.transport = FakeTransport(sync_pages)
+    sync_result = harvest.syncTimeEntries(store_path, request_workers=1)
+
+    assert 'updated_since' not in harvest.transport.urls[0]
+    assert list(sync_result['id']) == [1, 2, 3]
+    with SyncStore(store_path) as sync_store:
+        assert sync_store.getWatermark(harvest._syncResource(None, None)) == '2024-06-05T00:00:00Z'
@@ -0,0 +1,115 @@
+import pandas as pd
+import pytest
+
+from api_stream import rechunkRecords, writeChunks
+
+def test_rechunk_keeps_pages_without_a_chunk_size():
+    assert list(rechunkRecords([[1, 2], [], [3]])) == [[1, 2], [3]]
+
+def test_rechunk_rebatches_pages():
+    assert list(rechunkRecords([[1, 2], [3, 4, 5], [6]], 4)) == [[1, 2, 3, 4], [5, 6]]
+
+def test_csv_keeps_the_columns_of_every_chunk(tmp_path):
+    output_path = str(tmp_path / 'output.csv')
+    chunks = [pd.DataFrame({'id': [1], 'name': ['a']}), pd.DataFrame({'name': ['b'], 'id': [2]})]
+
+    assert writeChunks(chunks, output_path, 'csv') == 2
+    assert pd.read_csv(output_path).to_dict('list') == {'id': [1, 2], 'name': ['a', 'b']}
+
+def test_new_columns_in_later_chunks_raise(tmp_path):
+    chunks = [
+        pd.DataFrame({'id': [1], 'invoice': [None]}),
+        pd.DataFrame({'id': [2], 'invoice': [None], 'invoice.id': [9], 'invoice.number': ['A-9']}),
+    ]
+
+    with pytest.raises(ValueError, match='invoice.id'):
+        writeChunks(chunks, str(tmp_path / 'output.csv'), 'csv')
+
+def test_output_columns_fix_the_file_columns(tmp_path):
+    output_path = str(tmp_path / 'output.csv')
+    chunks = [pd.DataFrame({'id': [1]}), pd.DataFrame({'id': [2], 'invoice.id': [9], 'extra': ['x']})]
+
+    writeChunks(chunks, output_path, 'csv', output_columns=['id', 'invoice.id'])
+    assert pd.read_csv(output_path, dtype=str, keep_default_na=False).to_dict('list') == {'id': ['1', '2'], 'invoice.id': ['', '9']}
+
+def test_parquet_columns_that_start_null(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    output_path = str(tmp_path / 'output.parquet')
+    chunks = [
+        pd.DataFrame({'id': [1], 'timer_started_at': [None]}),
+        pd.DataFrame({'id': [2], 'timer_started_at': ['2024-06-01T10:00:00Z']}),
+    ]
+
+    assert writeChunks(chunks, output_path) == 2
+    assert pq.read_table(output_path).column('timer_started_at').to_pylist() == [None, '2024-06-01T10:00:00Z']
+
+def test_parquet_schema_fixes_the_types(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    output_path = str(tmp_path / 'output.parquet')
+    output_schema = pa.schema([('id', pa.int64()), ('hours', pa.float64())])
+    chunks = [pd.DataFrame({'id': [1], 'hours': [None]}), pd.DataFrame({'id': [2], 'hours': [1.5]})]
+
+    writeChunks(chunks, output_path, output_schema=output_schema)
+    assert pq.read_table(output_path).schema.equals(output_schema)
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+class FakeHarvestTransport:
+    # time entry pages by page number, only the later pages have invoiced entries
+    def __init__(self, pages):
+        self.pages = pages
+
+    def get(self, url, **kwargs):
+        page_cnt = int(url.rsplit('&page=', 1)[1]) if '&page=' in url else 1
+        return FakeResponse({'time_entries': self.pages[page_cnt], 'total_pages': len(self.pages)})
+
+def harvestEntry(entry_id, invoice=None):
+    return {
+        'id': entry_id, 'spent_date': '2024-06-01', 'hours': 1.5, 'notes': None, 'timer_started_at': None,
+        'user': {'id': 1, 'name': 'User'}, 'client': {'id': 1, 'name': 'Client', 'currency': 'USD'},
+        'invoice': invoice, 'updated_at': '2024-06-01T10:00:00Z',
+    }
+
+@pytest.fixture
+def harvest_stream(tmp_path):
+    from api_harvest import Harvest
+
+    credentials_path = tmp_path / 'harvest.json'
+    credentials_path.write_text('{"user_token": "token", "user_id": "1", "user_agent": "tests"}')
+    harvest = Harvest(str(credentials_path))
+    harvest.transport = FakeHarvestTransport({
+        1: [harvestEntry(1), harvestEntry(2)],
+        2: [{**harvestEntry(3, {'id': 9, 'number': 'A-9'}), 'project': {'id': 4, 'name': 'Project', 'code': 'P4'}, 'timer_started_at': '2024-06-01T10:00:00.250Z'}],
+    })
+
+    return harvest
+
+def test_time_entry_chunks_share_their_columns(harvest_stream):
+    from api_harvest import TIME_ENTRIES_FIELDS
+
+    chunks = list(harvest_stream.iterTimeEntries('20240101', '20241231', request_workers=1))
+
+    assert [len(chunk_ent) for chunk_ent in chunks] == [2, 1]
+    assert list(chunks[0].columns) == list(chunks[1].columns) == [field_path.replace('.', '_') for field_path in TIME_ENTRIES_FIELDS]
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_time_entries_stream_into_a_single_file(harvest_stream, tmp_path, output_format):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow.parquet')
+    output_path = str(tmp_path / f'time_entries.{output_format}')
+
+    assert writeChunks(harvest_stream.iterTimeEntries('20240101', '20241231', request_workers=1), output_path, output_format) == 3
+
+    output_frame = pd.read_csv(output_path, dtype=str) if output_format == 'csv' else pd.read_parquet(output_path)
+    assert [None if pd.isna(invoice_id) else str(invoice_id) for invoice_id in output_frame['invoice_id']] == [None, None, '9']
+    assert list(output_frame['invoice_number'].fillna('')) == ['', '', 'A-9']
+    # the categorical and datetime columns are all-null in the first chunk
+    assert list(output_frame['project_name'].astype(object).fillna('')) == ['', '', 'Project']
+    assert output_frame['timer_started_at'].notna().tolist() == [False, False, True]
@@ -0,0 +1,112 @@
+import json
+import threading
+import requests as rq
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import api_transport
+from api_transport import Transport
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+
+class FakeSession:
+    # answers with the given status codes (or raises the given exceptions) one call at a time
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+
+        return FakeResponse(reply)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock_state = {'now': 1000.0}
+    monkeypatch.setattr(api_transport.time, 'monotonic', lambda: clock_state['now'])
+    monkeypatch.setattr(api_transport.time, 'sleep', lambda seconds: None)
+
+    return clock_state
+
+def fakeTransport(replies, **kwargs):
+    transport = Transport(backoff_base=0, **kwargs)
+    transport._session('host')
+    transport._sessions['host'] = FakeSession(replies)
+
+    return transport
+
+def test_pace_keeps_every_window_under_the_limit(clock):
+    transport = Transport(rate_limits={'host': (2, 10)})
+    transport._session('host')
+    for _ in range(6):
+        transport._pace('host')
+
+    assert [sent_time - clock['now'] for sent_time in transport._hosts['host']['sent']] == [0, 0, 10, 10, 20, 20]
+
+def test_pace_frees_slots_once_the_window_passed(clock):
+    transport = Transport(rate_limits={'host': (2, 10)})
+    transport._session('host')
+    transport._pace('host')
+    transport._pace('host')
+
+    clock['now'] += 10
+    transport._pace('host')
+    assert list(transport._hosts['host']['sent']) == [1010.0]
+
+def test_get_is_retried_on_server_errors(clock):
+    transport = fakeTransport([503, 500, 200])
+    assert transport.get('https://host/resource').status_code == 200
+    assert transport._sessions['host'].calls == 3
+
+def test_post_is_not_retried_on_server_errors(clock):
+    transport = fakeTransport([503, 200])
+    assert transport.request('POST', 'https://host/resource').status_code == 503
+    assert transport._sessions['host'].calls == 1
+
+def test_post_is_not_retried_on_timeouts(clock):
+    transport = fakeTransport([rq.Timeout(), 200])
+    with pytest.raises(rq.Timeout):
+        transport.request('POST', 'https://host/resource')
+
+def test_post_is_retried_when_throttled_or_opted_in(clock):
+    transport = fakeTransport([429, 200])
+    assert transport.request('POST', 'https://host/resource').status_code == 200
+
+    transport = fakeTransport([503, 200])
+    assert transport.request('POST', 'https://host/resource', retry=True).status_code == 200
+
+def test_pooled_sessions_never_keep_cookies():
+    class CookieHandler(BaseHTTPRequestHandler):
+        # sets a cookie on every response and echoes the cookies it received
+        def do_GET(self):
+            reply_body = json.dumps({'cookie': self.headers.get('Cookie')}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Set-Cookie', 'tenant=a; Path=/')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(reply_body)))
+            self.end_headers()
+            self.wfile.write(reply_body)
+
+        def log_message(self, *args):
+            pass
+
+    cookie_server = ThreadingHTTPServer(('127.0.0.1', 0), CookieHandler)
+    threading.Thread(target=cookie_server.serve_forever, daemon=True).start()
+    try:
+        transport = Transport()
+        cookie_url = f'http://127.0.0.1:{cookie_server.server_port}/'
+
+        assert transport.get(cookie_url).json() == {'cookie': None}
+        assert transport.get(cookie_url).json() == {'cookie': None}
+        assert transport.get(cookie_url, cookies={'explicit': '1'}).json() == {'cookie': 'explicit=1'}
+        assert len(transport._session(f'127.0.0.1:{cookie_server.server_port}').cookies) == 0
+    finally:
+        cookie_server.shutdown()